@@ -0,0 +1,74 @@
+import numpy as np
+
+SAMPLE_RATE = 16000
+PCM16_SCALE = 1.0 / 32768.0
+
+
+class AudioRingBuffer:
+    """
+    Preallocated float32 ring buffer of 16 kHz mono audio.
+
+    Positions are absolute sample indices since the start of the stream, so callers
+    can address audio by stream time while the storage wraps around. When more
+    audio is written than fits, the oldest samples are overwritten.
+    """
+
+    def __init__(self, capacity_seconds: float = 60.0):
+        self._data = np.zeros(int(capacity_seconds * SAMPLE_RATE), dtype=np.float32)
+        self.start = 0  # absolute index of the oldest retained sample
+        self.end = 0  # absolute index one past the newest sample
+        self._odd_byte = b""  # first half of a PCM16 sample split across frames
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def write(self, samples: np.ndarray):
+        """Append float32 samples."""
+        self._write(samples, 1.0)
+
+    def write_pcm16(self, frame: bytes):
+        """
+        Append little-endian PCM16 samples. The frame is viewed in place with
+        `np.frombuffer` and converted straight into the ring storage. Frames may
+        be split on odd byte boundaries: a trailing odd byte is kept and
+        completed by the first byte of the next frame.
+        """
+        if self._odd_byte:
+            frame = self._odd_byte + frame
+            self._odd_byte = b""
+        if len(frame) % 2:
+            self._odd_byte = bytes(frame[-1:])
+            frame = memoryview(frame)[:-1]
+        self._write(np.frombuffer(frame, dtype="<i2"), PCM16_SCALE)
+
+    def read(self, headroom: int = 0) -> np.ndarray:
+        """
+        Return all retained samples. This is a view unless the data wraps around
+        or fewer than `headroom` samples are free: writes while the caller still
+        uses the view would overwrite its oldest samples otherwise.
+        """
+        first = self.start % self.capacity
+        last = first + len(self)
+        if last <= self.capacity:
+            view = self._data[first:last]
+            return view if self.capacity - len(self) >= headroom else view.copy()
+        return np.concatenate([self._data[first:], self._data[:last - self.capacity]])
+
+    def discard_until(self, index: int):
+        """Drop every sample before the absolute index `index`."""
+        self.start = min(max(self.start, index), self.end)
+
+    def _write(self, samples: np.ndarray, scale: float):
+        if len(samples) > self.capacity:
+            self.end += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+        position = self.end % self.capacity
+        head = min(len(samples), self.capacity - position)
+        np.multiply(samples[:head], scale, out=self._data[position:position + head], casting="unsafe")
+        np.multiply(samples[head:], scale, out=self._data[:len(samples) - head], casting="unsafe")
+        self.end += len(samples)
+        self.start = max(self.start, self.end - self.capacity)
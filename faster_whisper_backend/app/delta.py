@@ -0,0 +1,41 @@
+from typing import Dict, List
+
+from app.streaming import Word
+
+
+class SegmentTracker:
+    """
+    Turns the committed/pending words of every streaming tick into deltas over
+    segments with stable IDs.
+
+    The uncommitted tail of the stream is one provisional segment. It is sent as
+    `new` the first time, as `revised` whenever its text changes, and as `final`
+    with its words once it is committed; the next tail gets the next ID. Every
+    ID is finalized exactly once, and unchanged segments are never re-sent.
+    """
+
+    def __init__(self):
+        self.current_id = 0
+        self._sent_text = None  # last text sent for the provisional segment, None if never sent
+
+    def update(self, committed: List[Word], pending: List[Word]) -> List[Dict]:
+        deltas = []
+        if committed:
+            deltas.append({
+                "id": self.current_id,
+                "status": "final",
+                "text": " ".join(word.text for word in committed),
+                "words": [word.to_json() for word in committed],
+            })
+            self.current_id += 1
+            self._sent_text = None
+
+        text = " ".join(word.text for word in pending)
+        if text != (self._sent_text or ""):
+            deltas.append({
+                "id": self.current_id,
+                "status": "new" if self._sent_text is None else "revised",
+                "text": text,
+            })
+            self._sent_text = text
+        return deltas
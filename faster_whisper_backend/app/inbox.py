@@ -0,0 +1,51 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+
+@dataclass
+class InboxMessage:
+    payload: Any
+    seq: int  # number of messages received on the connection so far, including this one
+    received_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def lag_ms(self) -> float:
+        return (time.perf_counter() - self.received_at) * 1000
+
+
+class LatestWinsInbox:
+    """
+    Bounded per-connection inbox. When it is full, the oldest message is
+    discarded in favour of the new one, so a slow consumer always works on the
+    most recent data instead of falling further and further behind.
+    """
+
+    def __init__(self, maxsize: int = 1):
+        self._messages: deque[InboxMessage] = deque(maxlen=maxsize)
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, payload: Any = None):
+        self.received += 1
+        if len(self._messages) == self._messages.maxlen:
+            self.dropped += 1
+        self._messages.append(InboxMessage(payload, self.received))
+        self._ready.set()
+
+    def close(self):
+        self._closed = True
+        self._ready.set()
+
+    async def get(self) -> Optional[InboxMessage]:
+        """Return the next message, or None once the inbox is closed and drained."""
+        while not self._messages:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self._messages.popleft()
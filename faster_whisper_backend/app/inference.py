@@ -0,0 +1,124 @@
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+from faster_whisper import BatchedInferencePipeline
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from app.audio import SAMPLE_RATE
+from app.quality import QualityTier
+from app.streaming import Word
+
+# Whisper's receptive field; every clip handed to the batched pipeline must fit into it
+MAX_CLIP_SAMPLES = 30 * SAMPLE_RATE
+
+
+@dataclass
+class Segment:
+    text: str
+    start: float
+    end: float
+    words: List[Word]
+
+
+@dataclass
+class WindowResult:
+    segments: List[Segment]
+    tier: str
+    queue_seconds: float = 0.0
+    inference_seconds: float = 0.0
+    batch_size: int = 1
+
+
+def warmup(pipeline: BatchedInferencePipeline, tiers: List[QualityTier]):
+    """
+    Run every decoding setting once on synthetic audio, so CUDA/CTranslate2
+    kernels and the VAD model are initialised before the first real request.
+    """
+    audio = np.random.default_rng(0).normal(0.0, 0.01, 2 * SAMPLE_RATE).astype(np.float32)
+    get_speech_timestamps(audio, VadOptions())
+    for tier in tiers:
+        segments, _ = pipeline.transcribe(
+            audio,
+            language="en",
+            beam_size=tier.beam_size,
+            word_timestamps=tier.word_timestamps,
+            without_timestamps=tier.word_timestamps,
+            vad_filter=False,
+            clip_timestamps=[{"start": 0, "end": len(audio)}],
+        )
+        list(segments)
+
+
+def _voiced_clips(audio: np.ndarray) -> List[tuple]:
+    """Return (start, end) sample ranges spanning the speech in `audio`, each at most 30 s long."""
+    speech = get_speech_timestamps(audio, VadOptions())
+    if not speech:
+        return []
+    start, end = speech[0]["start"], speech[-1]["end"]
+    return [(s, min(s + MAX_CLIP_SAMPLES, end)) for s in range(start, end, MAX_CLIP_SAMPLES)]
+
+
+def transcribe_batch(
+    pipeline: BatchedInferencePipeline,
+    windows: List[np.ndarray],
+    tier: QualityTier,
+) -> Tuple[List[List[Segment]], float]:
+    """
+    Transcribe several independent audio windows in one batched forward pass.
+    Returns the segments of every window and the seconds of audio VAD kept.
+
+    The voiced part of every window is cut out and concatenated into a single
+    array, and `clip_timestamps` tells the pipeline where each clip starts and
+    ends, so every clip becomes its own element of the batch. Segments are then
+    mapped back to the window they came from, with times relative to that window.
+    Tiers without word timestamps still get segment-level timestamps.
+
+    This relies on faster-whisper 1.1: from 1.2 on, clip timestamps are read as
+    seconds and neighbouring clips are merged into chunks of up to 30 s, which
+    would mix windows of different sessions. The dependency is pinned to <1.2.
+    """
+    results: List[List[Segment]] = [[] for _ in windows]
+    pieces, clip_timestamps, owners, clip_starts, window_offsets = [], [], [], [], []
+    position = 0
+    for index, audio in enumerate(windows):
+        for start, end in _voiced_clips(audio):
+            pieces.append(audio[start:end])
+            # The batched pipeline takes clip timestamps in samples
+            clip_timestamps.append({"start": position, "end": position + end - start})
+            owners.append(index)
+            clip_starts.append(position / SAMPLE_RATE)
+            window_offsets.append((start - position) / SAMPLE_RATE)
+            position += end - start
+
+    voiced_seconds = position / SAMPLE_RATE
+    if not pieces:
+        return results, voiced_seconds
+
+    segments, _ = pipeline.transcribe(
+        np.concatenate(pieces),
+        language="en",
+        beam_size=tier.beam_size,
+        word_timestamps=tier.word_timestamps,
+        without_timestamps=tier.word_timestamps,
+        vad_filter=False,
+        clip_timestamps=clip_timestamps,
+        batch_size=len(clip_timestamps),
+    )
+    for segment in segments:
+        if not segment.text.strip():
+            continue
+        clip = bisect_right(clip_starts, segment.start + 1e-3) - 1
+        shift = window_offsets[clip]
+        results[owners[clip]].append(Segment(
+            text=segment.text.strip(),
+            start=segment.start + shift,
+            end=segment.end + shift,
+            words=[
+                Word(word.word.strip(), word.start + shift, word.end + shift)
+                for word in segment.words or []
+                if word.word.strip()
+            ],
+        ))
+    return results, voiced_seconds
@@ -5,16 +5,28 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect, BackgroundTasks
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from faster_whisper import WhisperModel
+from fastapi.responses import PlainTextResponse
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
 import asyncio
+import ctranslate2
 import logging
-import torch
 import io
 import os
+import time
 from dotenv import load_dotenv
 import aiohttp
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Tuple
+
+from app import metrics
+from app.audio import SAMPLE_RATE
+from app.delta import SegmentTracker
+from app.inbox import InboxMessage, LatestWinsInbox
+from app.inference import WindowResult, transcribe_batch, warmup
+from app.pool import ModelPool
+from app.quality import QualityPolicy, default_tiers
+from app.scheduler import BatchScheduler
+from app.streaming import StreamingTranscriber, Word
 
 # Load environment variables
 load_dotenv()
@@ -33,68 +45,298 @@ app.add_middleware(
 # --- Your Model Loading Logic ---
 #MODEL_NAME = "distil-whisper/distil-large-v3.5-ct2"
 MODEL_NAME = "small"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# Ask CTranslate2 directly, importing torch just for this costs seconds at boot
+DEVICE = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
 COMPUTE_TYPE = "int8"
 MODEL_PATH = os.getenv("WHISPER_MODEL_PATH", "./whisper_models")
+MAX_BATCH_SIZE = int(os.getenv("WHISPER_MAX_BATCH_SIZE", "8"))
+MAX_BATCH_WAIT_MS = float(os.getenv("WHISPER_MAX_BATCH_WAIT_MS", "50"))
+# CPU only: number of model replicas, each in its own process (0 = one in-process model)
+POOL_WORKERS = int(os.getenv("WHISPER_POOL_WORKERS", "0")) if DEVICE == "cpu" else 0
+POOL_CPU_THREADS = int(os.getenv("WHISPER_POOL_CPU_THREADS", "0")) or None
+# Messages a connection may queue while its previous one is transcribed; older ones are superseded
+INBOX_SIZE = int(os.getenv("WHISPER_INBOX_SIZE", "1"))
+# Under load, step down to greedy decoding, then no word timestamps, then this smaller preloaded model
+ADAPTIVE_QUALITY = os.getenv("WHISPER_ADAPTIVE_QUALITY", "1") == "1"
+FALLBACK_MODEL_NAME = os.getenv("WHISPER_FALLBACK_MODEL", "")
+RTF_HIGH = float(os.getenv("WHISPER_RTF_HIGH", "0.5"))
+RTF_LOW = float(os.getenv("WHISPER_RTF_LOW", "0.2"))
+QUEUE_HIGH = int(os.getenv("WHISPER_QUEUE_HIGH", "4"))
 
-logger.info(f"Loading model '{MODEL_NAME}'...")
-model = WhisperModel(MODEL_NAME, device=DEVICE, compute_type=COMPUTE_TYPE, download_root=MODEL_PATH)
-logger.info("Model loaded successfully.")
+tiers = default_tiers(MODEL_NAME, FALLBACK_MODEL_NAME or None)
+policy = QualityPolicy(
+    tiers if ADAPTIVE_QUALITY else tiers[:1],
+    rtf_high=RTF_HIGH,
+    rtf_low=RTF_LOW,
+    queue_high=QUEUE_HIGH,
+)
 
-@app.websocket("/listen")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    logger.info("WebSocket connection established.")
+# Models are loaded in the background after boot: "loading" -> "warming_up" -> "ready" (or "failed")
+model_status = "loading"
+
+pool = None
+pipelines = {}
+if POOL_WORKERS > 0:
+    pool = ModelPool(POOL_WORKERS, policy.models, COMPUTE_TYPE, MODEL_PATH, cpu_threads=POOL_CPU_THREADS)
+    run_batch = pool.run_batch
+else:
+    async def run_batch(windows, tier):
+        return await asyncio.to_thread(transcribe_batch, pipelines[tier.model], windows, tier)
+
+def load_pipelines():
+    for model_name in policy.models:
+        logger.info(f"Loading model '{model_name}'...")
+        model = WhisperModel(model_name, device=DEVICE, compute_type=COMPUTE_TYPE, download_root=MODEL_PATH)
+        pipelines[model_name] = BatchedInferencePipeline(model=model)
+    logger.info("Model loaded successfully.")
+
+def warmup_pipelines():
+    for model_name, pipeline in pipelines.items():
+        warmup(pipeline, [tier for tier in policy.tiers if tier.model == model_name])
+
+# All connections share one scheduler, so concurrent tables are served by batched forward passes
+scheduler = BatchScheduler(
+    run_batch,
+    policy,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait=MAX_BATCH_WAIT_MS / 1000,
+    concurrency=POOL_WORKERS or 1,
+)
+metrics.registry.gauge("whisper_queue_depth", "Windows waiting for a batch.", lambda: scheduler.queue.qsize())
+metrics.registry.gauge("whisper_realtime_factor_smoothed", "Moving average of the real-time factor.", lambda: policy.rtf)
+metrics.registry.gauge("whisper_quality_level", "Current quality tier, 0 is the best.", lambda: policy.level)
+if pool:
+    metrics.registry.gauge("whisper_pool_busy_workers", "Model pool workers currently transcribing.", lambda: pool.busy)
+
+async def load_models():
+    global model_status
+    start = time.perf_counter()
+    try:
+        if pool:
+            logger.info(f"Starting a pool of {POOL_WORKERS} replicas of {policy.models}...")
+            model_status = "warming_up"
+            await pool.start(policy.tiers)
+        else:
+            await asyncio.to_thread(load_pipelines)
+            model_status = "warming_up"
+            await asyncio.to_thread(warmup_pipelines)
+    except Exception as e:
+        model_status = "failed"
+        logger.exception(f"Failed to load the model: {e}")
+        return
+    scheduler.start()
+    model_status = "ready"
+    logger.info(f"Model ready after {time.perf_counter() - start:.1f}s.")
+
+@app.on_event("startup")
+async def start_loading_models():
+    # Don't block boot on the model, / reports the progress meanwhile
+    app.state.model_loader = asyncio.create_task(load_models())
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+    if pool:
+        pool.shutdown()
+
+async def transcribe_words(audio, offset: float) -> Tuple[List[Word], WindowResult]:
+    """
+    Transcribe a float32 window and return its words on the absolute stream
+    timeline, along with the scheduler's result (tier and timing). Tiers without
+    word timestamps yield whole segments as the units to agree on.
+    """
+    result = await scheduler.transcribe(audio)
+    words = []
+    for segment in result.segments:
+        units = segment.words or [Word(segment.text, segment.start, segment.end)]
+        words.extend(Word(unit.text, offset + unit.start, offset + unit.end) for unit in units)
+    return words, result
+
+def enqueue(inbox: LatestWinsInbox, payload=None):
+    superseded = inbox.dropped
+    inbox.put(payload)
+    metrics.messages_received.inc()
+    metrics.messages_superseded.inc(inbox.dropped - superseded)
+
+def decoded(audio_seconds: float, decode_seconds: float):
+    metrics.audio_seconds_received.inc(audio_seconds)
+    metrics.decode_seconds.observe(decode_seconds)
+
+async def receive_stream(websocket: WebSocket, transcriber: StreamingTranscriber, encoding: str, inbox: LatestWinsInbox):
+    """
+    Read clips as fast as they arrive and append them to the rolling buffer. Each
+    clip only queues a "transcribe now" tick; ticks that pile up while the model
+    is busy are coalesced, the next pass covers their audio anyway.
+    """
+    try:
+        while True:
+            audio_clip = await websocket.receive_bytes()
+            logger.info(f"Received a streaming {encoding} clip of {len(audio_clip)} bytes.")
+            try:
+                decode_start = time.perf_counter()
+                buffered = transcriber.buffer.end
+                if encoding == "pcm16":
+                    # Cheap enough to run inline, no container to parse
+                    transcriber.append_pcm16(audio_clip)
+                else:
+                    transcriber.append(await asyncio.to_thread(decode_audio, io.BytesIO(audio_clip)))
+                decode_seconds = time.perf_counter() - decode_start
+                decoded((transcriber.buffer.end - buffered) / SAMPLE_RATE, decode_seconds)
+                enqueue(inbox, decode_seconds)
+            except Exception as e:
+                logger.error(f"Could not decode a streaming clip: {e}")
+    finally:
+        inbox.close()
 
+async def receive_files(websocket: WebSocket, inbox: LatestWinsInbox):
+    """Read whole recordings as fast as they arrive; a newer one supersedes any still waiting."""
     try:
         while True:
             audio_file_chunk = await websocket.receive_bytes()
             logger.info(f"Received a complete audio file of {len(audio_file_chunk)} bytes.")
+            enqueue(inbox, audio_file_chunk)
+    finally:
+        inbox.close()
+
+def progress(inbox: LatestWinsInbox, message: InboxMessage) -> Dict:
+    """Backpressure information attached to every result."""
+    return {"received": message.seq, "dropped": inbox.dropped, "lag_ms": round(message.lag_ms, 1)}
 
+def stage_timing(result: WindowResult, message: InboxMessage, decode_seconds: float) -> Dict:
+    """Per-stage latency of a result, attached when the client connects with `timings=1`."""
+    return {"timing": {
+        "decode_ms": round(decode_seconds * 1000, 1),
+        "queue_ms": round(result.queue_seconds * 1000, 1),
+        "inference_ms": round(result.inference_seconds * 1000, 1),
+        "batch_size": result.batch_size,
+        "total_ms": round(message.lag_ms, 1),
+    }}
+
+async def stream_session(websocket: WebSocket, encoding: str, inbox: LatestWinsInbox, timings: bool):
+    """
+    Streaming mode: every message carries only the audio recorded since the last
+    one, either as a self-contained clip (`encoding=webm`) or as raw 16 kHz mono
+    little-endian PCM16 samples (`encoding=pcm16`). Only the uncommitted tail of
+    the stream is re-transcribed each tick. Results are sent as deltas over
+    segments with stable IDs, see SegmentTracker.
+    """
+    transcriber = StreamingTranscriber()
+    tracker = SegmentTracker()
+    receiver = asyncio.create_task(receive_stream(websocket, transcriber, encoding, inbox))
+    try:
+        while (message := await inbox.get()) is not None:
             try:
-                segments, info = await asyncio.to_thread(
-                    model.transcribe,
-                    io.BytesIO(audio_file_chunk),
-                    beam_size=5,
-                    language="en",
-                    vad_filter=True,
-                    word_timestamps=True
+                audio, offset = transcriber.window()
+                words, result = await transcribe_words(audio, offset)
+                logger.info(
+                    f"Tick timing: decode {message.payload * 1000:.1f}ms, queue {result.queue_seconds * 1000:.1f}ms, "
+                    f"inference {result.inference_seconds * 1000:.1f}ms for a {len(audio) / SAMPLE_RATE:.2f}s window, "
+                    f"{message.lag_ms:.0f}ms behind."
                 )
+                committed = transcriber.update(words, offset + len(audio) / SAMPLE_RATE)
+                deltas = tracker.update(committed, transcriber.pending())
 
-                results = []
-                for segment in segments:
-                    if segment.text.strip():
-                        segment_data = {
-                            "text": segment.text.strip(),
-                            "words": [
-                                {"word": word.word.strip(), "start": word.start, "end": word.end}
-                                for word in segment.words
-                            ]
-                        }
-                        results.append(segment_data)
+                if deltas:
+                    logger.info(f"SUCCESS: Committed {len(committed)} words, sending {len(deltas)} segment deltas.")
+                    await websocket.send_json({
+                        "type": "delta",
+                        "segments": deltas,
+                        "tier": result.tier,
+                        **progress(inbox, message),
+                        **(stage_timing(result, message, message.payload) if timings else {})
+                    })
+                elif not words:
+                    logger.info("VAD filtered all audio, no speech detected in this window.")
+
+            except Exception as e:
+                logger.error(f"Transcription error on a streaming window: {e}")
+        await receiver
+    finally:
+        receiver.cancel()
+
+async def file_session(websocket: WebSocket, inbox: LatestWinsInbox, timings: bool):
+    """Default mode: every message is the whole recording so far and is transcribed from scratch."""
+    receiver = asyncio.create_task(receive_files(websocket, inbox))
+    previous_seconds = 0.0
+    try:
+        while (message := await inbox.get()) is not None:
+            try:
+                decode_start = time.perf_counter()
+                audio = await asyncio.to_thread(decode_audio, io.BytesIO(message.payload))
+                decode_seconds = time.perf_counter() - decode_start
+                # Every recording repeats the previous ones, only count what is new
+                decoded(max(0.0, len(audio) / SAMPLE_RATE - previous_seconds), decode_seconds)
+                previous_seconds = max(previous_seconds, len(audio) / SAMPLE_RATE)
+                result = await scheduler.transcribe(audio)
+
+                results = [
+                    {"text": segment.text, "words": [word.to_json() for word in segment.words]}
+                    for segment in result.segments
+                ]
 
                 if results:
-                    logger.info(f"SUCCESS: Transcribed {info.duration:.2f}s of audio and sending results.")
-                    await websocket.send_json({"type": "transcription", "segments": results})
+                    logger.info(f"SUCCESS: Transcribed {len(audio) / SAMPLE_RATE:.2f}s of audio and sending results.")
+                    await websocket.send_json({
+                        "type": "transcription",
+                        "segments": results,
+                        "tier": result.tier,
+                        **progress(inbox, message),
+                        **(stage_timing(result, message, decode_seconds) if timings else {})
+                    })
                 else:
                     logger.info("VAD filtered all audio, no speech detected in this chunk.")
 
             except Exception as e:
                 logger.error(f"Transcription error on a chunk: {e}")
+        await receiver
+    finally:
+        receiver.cancel()
+
+@app.websocket("/listen")
+async def websocket_endpoint(websocket: WebSocket, mode: str = "full", encoding: str = "webm", timings: bool = False):
+    if encoding not in ("webm", "pcm16"):
+        await websocket.close(code=1003, reason=f"Unsupported encoding '{encoding}'")
+        return
+    if model_status != "ready":
+        await websocket.close(code=1013, reason=f"Model is {model_status}, try again later")
+        return
+    await websocket.accept()
+    logger.info(f"WebSocket connection established (mode={mode}, encoding={encoding}).")
+
+    inbox = LatestWinsInbox(maxsize=INBOX_SIZE)
+    scheduler.register_session()
+    metrics.active_connections.inc()
+    try:
+        # Raw PCM has no container, so it can only be streamed incrementally
+        if mode == "stream" or encoding == "pcm16":
+            await stream_session(websocket, encoding, inbox, timings)
+        else:
+            await file_session(websocket, inbox, timings)
 
     except WebSocketDisconnect:
-        logger.info("Client disconnected.")
+        logger.info(f"Client disconnected ({inbox.dropped} of {inbox.received} messages superseded).")
     except Exception as e:
         logger.error(f"An unexpected websocket error occurred: {e}")
+    finally:
+        scheduler.unregister_session()
+        metrics.active_connections.dec()
 
 @app.get("/")
 async def health_check():
     return {
-        "status": "healthy",
+        "status": model_status,
         "model": MODEL_NAME,
         "device": DEVICE,
-        "compute_type": COMPUTE_TYPE
+        "compute_type": COMPUTE_TYPE,
+        "active_sessions": scheduler.active_sessions,
+        "queued_windows": scheduler.queue.qsize(),
+        "pool": pool.occupancy() if pool else None,
+        "quality": policy.status()
     }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,169 @@
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"] + self.samples()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        # Unlabelled series are exported as 0 from the start
+        self._values: Dict[tuple, float] = {} if self.labels else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, *label_values: str):
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}"
+            for values, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    """A gauge that is either set explicitly or read from `callback` at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self.callback = callback
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1.0):
+        self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self._value -= amount
+
+    def samples(self) -> List[str]:
+        value = self.callback() if self.callback else self._value
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series: Dict[tuple, list] = {} if self.labels else {(): [0] * len(self.buckets) + [0.0]}
+
+    def observe(self, value: float, *label_values: str):
+        # [bucket counts..., sum]
+        series = self._series.setdefault(label_values, [0] * len(self.buckets) + [0.0])
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-1] += value
+
+    def total(self) -> float:
+        """Sum of all observed values across every label set."""
+        return sum(series[-1] for series in self._series.values())
+
+    def count(self) -> int:
+        return sum(series[len(self.buckets) - 1] for series in self._series.values())
+
+    def samples(self) -> List[str]:
+        lines = []
+        for values, series in self._series.items():
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.labels, values, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {series[len(self.buckets) - 1]}")
+        return lines
+
+
+class Registry:
+    """Minimal registry that renders the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, callback))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets, labels))
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+audio_seconds_received = registry.counter(
+    "whisper_audio_seconds_received_total", "Seconds of audio received over /listen.")
+messages_received = registry.counter(
+    "whisper_messages_received_total", "Audio messages received over /listen.")
+messages_superseded = registry.counter(
+    "whisper_messages_superseded_total", "Audio messages discarded by latest-wins coalescing.")
+decode_seconds = registry.histogram(
+    "whisper_decode_seconds", "Time spent decoding one audio message.", LATENCY_BUCKETS)
+queue_seconds = registry.histogram(
+    "whisper_queue_seconds", "Time a window waited for its batch to be dispatched.", LATENCY_BUCKETS)
+inference_seconds = registry.histogram(
+    "whisper_inference_seconds", "Time spent transcribing one batch.", LATENCY_BUCKETS, labels=("tier",))
+realtime_factor = registry.histogram(
+    "whisper_realtime_factor", "Inference time per second of audio of one batch.", RTF_BUCKETS, labels=("tier",))
+batch_size = registry.histogram(
+    "whisper_batch_size", "Number of windows per dispatched batch.", BATCH_BUCKETS)
+vad_input_seconds = registry.counter(
+    "whisper_vad_input_seconds_total", "Seconds of audio passed through voice activity detection.")
+vad_dropped_seconds = registry.counter(
+    "whisper_vad_dropped_seconds_total", "Seconds of audio dropped as silence by voice activity detection.")
+vad_dropped_ratio = registry.gauge(
+    "whisper_vad_dropped_ratio", "Share of all audio dropped as silence by voice activity detection.",
+    lambda: vad_dropped_seconds.value() / vad_input_seconds.value() if vad_input_seconds.value() else 0.0)
+active_connections = registry.gauge(
+    "whisper_active_connections", "Open /listen connections.")
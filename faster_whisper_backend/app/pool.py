@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.inference import Segment
+from app.quality import QualityTier
+
+logger = logging.getLogger(__name__)
+
+# Set inside every worker process by _init_worker, one pipeline per model name
+_pipelines = {}
+
+
+def _init_worker(slot: int, model_names: List[str], compute_type: str, model_path: str, cpu_threads: int):
+    from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+    if hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        pinned = cores[slot * cpu_threads:(slot + 1) * cpu_threads]
+        if pinned:
+            os.sched_setaffinity(0, pinned)
+    for model_name in model_names:
+        model = WhisperModel(
+            model_name,
+            device="cpu",
+            compute_type=compute_type,
+            download_root=model_path,
+            cpu_threads=cpu_threads,
+            num_workers=1,
+        )
+        _pipelines[model_name] = BatchedInferencePipeline(model=model)
+
+
+def _warmup(tiers: List[QualityTier]) -> int:
+    from app.inference import warmup
+
+    for model_name, pipeline in _pipelines.items():
+        warmup(pipeline, [tier for tier in tiers if tier.model == model_name])
+    return os.getpid()
+
+
+def _run_batch(windows: List[np.ndarray], tier: QualityTier) -> Tuple[List[List[Segment]], float]:
+    from app.inference import transcribe_batch
+
+    return transcribe_batch(_pipelines[tier.model], windows, tier)
+
+
+class ModelPool:
+    """
+    A fixed set of model replicas for CPU-only hosts, each loaded in its own
+    worker process and pinned to its own `cpu_threads` cores.
+
+    Batches are handed to whichever replica is idle, so up to `workers`
+    transcriptions run in parallel.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        model_names: List[str],
+        compute_type: str,
+        model_path: str,
+        cpu_threads: Optional[int] = None,
+    ):
+        self.workers = workers
+        self.cpu_threads = cpu_threads or max(1, (os.cpu_count() or 1) // workers)
+        self._worker_args = (model_names, compute_type, model_path, self.cpu_threads)
+        self._executors = [self._spawn(slot) for slot in range(workers)]
+        self._idle: asyncio.Queue[int] = asyncio.Queue()
+        for slot in range(workers):
+            self._idle.put_nowait(slot)
+
+    @property
+    def busy(self) -> int:
+        return self.workers - self._idle.qsize()
+
+    def occupancy(self) -> dict:
+        return {
+            "workers": self.workers,
+            "cpu_threads": self.cpu_threads,
+            "busy": self.busy,
+            "occupancy": self.busy / self.workers,
+        }
+
+    def _spawn(self, slot: int) -> ProcessPoolExecutor:
+        # Spawn rather than fork, the parent already runs threads
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(slot, *self._worker_args),
+        )
+
+    async def start(self, tiers: List[QualityTier]):
+        """Load and warm up every replica up front instead of on the first request."""
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*[loop.run_in_executor(executor, _warmup, tiers) for executor in self._executors])
+        logger.info(f"Model pool ready: {self.workers} workers with {self.cpu_threads} threads each (pids {pids}).")
+
+    async def run_batch(self, windows: List[np.ndarray], tier: QualityTier) -> Tuple[List[List[Segment]], float]:
+        slot = await self._idle.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executors[slot], _run_batch, windows, tier)
+        except BrokenProcessPool:
+            logger.error(f"Worker {slot} of the model pool died, restarting it.")
+            self._executors[slot] = self._spawn(slot)
+            raise
+        finally:
+            self._idle.put_nowait(slot)
+
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,99 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QualityTier:
+    name: str
+    model: str
+    beam_size: int
+    word_timestamps: bool
+
+
+def default_tiers(model_name: str, fallback_model_name: Optional[str] = None) -> List[QualityTier]:
+    """Tiers from best to cheapest; the smaller model is only used if one is configured."""
+    tiers = [
+        QualityTier("full", model_name, beam_size=5, word_timestamps=True),
+        QualityTier("greedy", model_name, beam_size=1, word_timestamps=True),
+        QualityTier("fast", model_name, beam_size=1, word_timestamps=False),
+    ]
+    if fallback_model_name:
+        tiers.append(QualityTier("fallback", fallback_model_name, beam_size=1, word_timestamps=False))
+    return tiers
+
+
+class QualityPolicy:
+    """
+    Load-aware choice of the quality tier used for the next batch.
+
+    It keeps an exponential moving average of the real-time factor (inference
+    time per second of audio) and looks at the scheduler's queue depth. Over
+    budget, it steps down one tier at a time; once load has stayed low for
+    `step_up_after` seconds it steps back up. Steps are at least `cooldown`
+    seconds apart so one slow batch does not make it oscillate.
+    """
+
+    def __init__(
+        self,
+        tiers: List[QualityTier],
+        rtf_high: float = 0.5,
+        rtf_low: float = 0.2,
+        queue_high: int = 4,
+        cooldown: float = 2.0,
+        step_up_after: float = 10.0,
+        smoothing: float = 0.3,
+    ):
+        self.tiers = tiers
+        self.rtf_high = rtf_high
+        self.rtf_low = rtf_low
+        self.queue_high = queue_high
+        self.cooldown = cooldown
+        self.step_up_after = step_up_after
+        self.smoothing = smoothing
+        self.level = 0
+        self.rtf = 0.0
+        self._last_change = 0.0
+        self._calm_since: Optional[float] = None
+
+    @property
+    def tier(self) -> QualityTier:
+        return self.tiers[self.level]
+
+    @property
+    def models(self) -> List[str]:
+        return list(dict.fromkeys(tier.model for tier in self.tiers))
+
+    def observe(self, audio_seconds: float, inference_seconds: float, queue_depth: int):
+        """Record one finished batch and adjust the tier if needed."""
+        if audio_seconds > 0:
+            rtf = inference_seconds / audio_seconds
+            self.rtf = rtf if self.rtf == 0.0 else self.smoothing * rtf + (1 - self.smoothing) * self.rtf
+
+        now = time.monotonic()
+        overloaded = self.rtf > self.rtf_high or queue_depth > self.queue_high
+        calm = self.rtf < self.rtf_low and queue_depth == 0
+        self._calm_since = (self._calm_since or now) if calm else None
+
+        if now - self._last_change < self.cooldown:
+            return
+        if overloaded and self.level < len(self.tiers) - 1:
+            self._step(+1, now, queue_depth)
+        elif calm and self.level > 0 and now - self._calm_since >= self.step_up_after:
+            self._step(-1, now, queue_depth)
+
+    def _step(self, direction: int, now: float, queue_depth: int):
+        previous = self.tier
+        self.level += direction
+        self._last_change = now
+        self._calm_since = None
+        logger.info(
+            f"Quality tier {previous.name} -> {self.tier.name} "
+            f"(rtf {self.rtf:.2f}, queue depth {queue_depth})."
+        )
+
+    def status(self) -> dict:
+        return {"tier": self.tier.name, "rtf": round(self.rtf, 3), "tiers": [tier.name for tier in self.tiers]}
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Tuple
+
+import numpy as np
+
+from app import metrics
+from app.audio import SAMPLE_RATE
+from app.inference import Segment, WindowResult
+from app.quality import QualityPolicy, QualityTier
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingWindow:
+    audio: np.ndarray
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class BatchScheduler:
+    """
+    Collects audio windows from all open /listen connections and runs them through
+    the model in batches.
+
+    A batch is dispatched as soon as it is full, as soon as every registered
+    session has a window waiting, or once the oldest window has waited
+    `max_wait` seconds. A single session therefore never waits for a batch to
+    fill up, while concurrent tables share one forward pass. Up to
+    `concurrency` batches are in flight at once (one per model replica). The
+    quality policy picks the tier of every batch and is fed its timing.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[np.ndarray], QualityTier], Awaitable[Tuple[List[List[Segment]], float]]],
+        policy: QualityPolicy,
+        max_batch_size: int = 8,
+        max_wait: float = 0.05,
+        concurrency: int = 1,
+    ):
+        self.run_batch = run_batch
+        self.policy = policy
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.concurrency = concurrency
+        self.active_sessions = 0
+        self.queue: asyncio.Queue[PendingWindow] = asyncio.Queue()
+        self._task = None
+        self._in_flight = set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def register_session(self):
+        self.active_sessions += 1
+
+    def unregister_session(self):
+        self.active_sessions -= 1
+
+    async def transcribe(self, audio: np.ndarray) -> WindowResult:
+        """Queue a window for the next batch and wait for its segments."""
+        window = PendingWindow(audio, asyncio.get_running_loop().create_future())
+        await self.queue.put(window)
+        return await window.future
+
+    async def _collect(self) -> List[PendingWindow]:
+        batch = [await self.queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < min(self.max_batch_size, max(self.active_sessions, 1)):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        while len(batch) < self.max_batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            # Only start collecting once a replica is free, so batches keep
+            # growing while all of them are busy
+            await slots.acquire()
+            batch = await self._collect()
+            task = asyncio.create_task(self._dispatch(batch, slots))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch: List[PendingWindow], slots: asyncio.Semaphore):
+        tier = self.policy.tier
+        for window in batch:
+            metrics.queue_seconds.observe(time.perf_counter() - window.enqueued_at)
+        logger.info(f"Dispatching a batch of {len(batch)} windows at tier {tier.name}.")
+        try:
+            inference_start = time.perf_counter()
+            results, voiced_seconds = await self.run_batch([window.audio for window in batch], tier)
+            elapsed = time.perf_counter() - inference_start
+            audio_seconds = sum(len(window.audio) for window in batch) / SAMPLE_RATE
+            self.policy.observe(audio_seconds, elapsed, self.queue.qsize())
+
+            metrics.batch_size.observe(len(batch))
+            metrics.inference_seconds.observe(elapsed, tier.name)
+            if audio_seconds:
+                metrics.realtime_factor.observe(elapsed / audio_seconds, tier.name)
+            metrics.vad_input_seconds.inc(audio_seconds)
+            metrics.vad_dropped_seconds.inc(audio_seconds - voiced_seconds)
+
+            for window, segments in zip(batch, results):
+                if not window.future.done():
+                    window.future.set_result(WindowResult(
+                        segments,
+                        tier.name,
+                        queue_seconds=inference_start - window.enqueued_at,
+                        inference_seconds=elapsed,
+                        batch_size=len(batch),
+                    ))
+        except Exception as e:
+            logger.error(f"Batched transcription failed: {e}")
+            for window in batch:
+                if not window.future.done():
+                    window.future.set_exception(e)
+        finally:
+            slots.release()
@@ -0,0 +1,123 @@
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+
+from app.audio import SAMPLE_RATE, AudioRingBuffer
+
+
+@dataclass
+class Word:
+    text: str
+    start: float
+    end: float
+
+    def to_json(self) -> dict:
+        return {"word": self.text, "start": self.start, "end": self.end}
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^\w']", "", text.lower())
+
+
+class StreamingTranscriber:
+    """
+    Per-connection state for incremental transcription of a live audio stream.
+
+    Audio is kept in a rolling buffer that only holds the uncommitted tail plus a
+    short overlap. Every pass over that window produces a hypothesis; words are
+    committed once two consecutive passes agree on them (local agreement), after
+    which the audio behind them is dropped. The window therefore stays bounded no
+    matter how long the session runs.
+    """
+
+    def __init__(self, overlap: float = 1.0, max_window: float = 20.0, silence_keep: float = 3.0):
+        self.overlap = overlap
+        self.max_window = max_window
+        self.silence_keep = silence_keep
+        # Room for the largest window plus the audio that arrives while it is transcribed
+        self.buffer = AudioRingBuffer(capacity_seconds=3 * max_window)
+        self.committed_until = 0.0
+        self.recent_committed: List[Word] = []
+        self.hypothesis: List[Word] = []
+
+    @property
+    def audio_offset(self) -> float:
+        """Absolute stream time of the oldest buffered sample."""
+        return self.buffer.start / SAMPLE_RATE
+
+    @property
+    def buffer_end(self) -> float:
+        return self.buffer.end / SAMPLE_RATE
+
+    def append(self, samples: np.ndarray):
+        """Append 16 kHz mono float32 samples to the rolling buffer."""
+        self.buffer.write(samples)
+
+    def append_pcm16(self, frame: bytes):
+        """Append 16 kHz mono little-endian PCM16 samples to the rolling buffer."""
+        self.buffer.write_pcm16(frame)
+
+    def window(self) -> Tuple[np.ndarray, float]:
+        """
+        Return the audio that still needs transcribing and its absolute start time.
+        A window that grew past the room left for incoming audio, e.g. a long
+        segment without word timestamps, is copied out of the ring buffer.
+        """
+        return self.buffer.read(headroom=int(self.max_window * SAMPLE_RATE)), self.audio_offset
+
+    def update(self, words: List[Word], window_end: float) -> List[Word]:
+        """
+        Feed the words of a pass over `window()` (absolute timestamps) and return
+        the words that became stable with this pass. `window_end` is the absolute
+        end of the transcribed window: audio appended after it has not been seen
+        yet and is never trimmed.
+        """
+        fresh = self._drop_already_committed(words)
+
+        agreed = 0
+        for new, old in zip(fresh, self.hypothesis):
+            if _normalize(new.text) != _normalize(old.text):
+                break
+            agreed += 1
+        committed = fresh[:agreed]
+        self.hypothesis = fresh[agreed:]
+
+        # Nothing has been stable for too long: commit everything that is not
+        # right at the edge of the buffer so the window stays bounded.
+        if window_end - self.audio_offset > self.max_window:
+            cutoff = window_end - self.overlap
+            forced = [w for w in self.hypothesis if w.end <= cutoff]
+            committed += forced
+            self.hypothesis = self.hypothesis[len(forced):]
+
+        if committed:
+            self.committed_until = committed[-1].end
+            self.recent_committed = (self.recent_committed + committed)[-5:]
+
+        trim_to = self.committed_until - self.overlap
+        if not self.hypothesis:
+            # Silence (or everything committed): keep only a short tail in case
+            # speech is just starting at the edge of the buffer.
+            trim_to = max(trim_to, window_end - self.silence_keep)
+        self._trim(min(trim_to, window_end))
+        return committed
+
+    def pending(self) -> List[Word]:
+        """Words seen in the latest pass that are not stable yet."""
+        return list(self.hypothesis)
+
+    def _drop_already_committed(self, words: List[Word]) -> List[Word]:
+        fresh = [w for w in words if (w.start + w.end) / 2 > self.committed_until]
+        # The overlap region gets re-transcribed; drop a repeated n-gram at the seam.
+        if not fresh or fresh[0].start > self.committed_until + self.overlap:
+            return fresh
+        tail = [_normalize(w.text) for w in self.recent_committed]
+        for n in range(min(len(tail), len(fresh)), 0, -1):
+            if tail[-n:] == [_normalize(w.text) for w in fresh[:n]]:
+                return fresh[n:]
+        return fresh
+
+    def _trim(self, until: float):
+        self.buffer.discard_until(int(until * SAMPLE_RATE))
@@ -0,0 +1,255 @@
+"""
+Replay-based load and latency benchmark for the /listen websocket.
+
+Starts the FastAPI app in-process, then replays recorded audio fixtures over N
+concurrent simulated clients that send a message every 2 s, like the recorder
+widget does. For every concurrency level it reports end-to-end latency
+percentiles, real-time factor and throughput, and writes all results to a JSON
+file so runs can be compared over time.
+
+Run from the faster_whisper_backend directory:
+
+    uv run python -m bench.listen_bench --fixtures bench/fixtures --concurrency 1,2,4,8
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import threading
+import time
+import wave
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import uvicorn
+import websockets
+from faster_whisper import decode_audio
+
+SAMPLE_RATE = 16000
+AUDIO_EXTENSIONS = {".wav", ".webm", ".ogg", ".mp3", ".flac", ".m4a"}
+
+
+def load_fixtures(paths: List[str]) -> List[np.ndarray]:
+    files = []
+    for path in map(Path, paths):
+        if not path.exists():
+            raise SystemExit(
+                f"Audio fixture {path} not found. No recordings ship with the repository: put a few "
+                f"clips of speech into bench/fixtures or pass their paths with --fixtures"
+            )
+        if path.is_dir():
+            files.extend(sorted(p for p in path.iterdir() if p.suffix.lower() in AUDIO_EXTENSIONS))
+        else:
+            files.append(path)
+    if not files:
+        raise SystemExit(f"No audio fixtures found in {paths}")
+    return [decode_audio(str(file), sampling_rate=SAMPLE_RATE) for file in files]
+
+
+def to_pcm16(audio: np.ndarray) -> bytes:
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def to_wav(audio: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(to_pcm16(audio))
+    return buffer.getvalue()
+
+
+def percentile(values: List[float], q: float, scale: float = 1.0) -> float:
+    if not values:
+        return None
+    return float(np.percentile(values, q)) * scale
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+class InProcessServer:
+    """Runs the app with uvicorn in a background thread of this process."""
+
+    def __init__(self, app, port: int):
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+async def run_client(url: str, audio: np.ndarray, args) -> Dict:
+    """Replay one fixture in real time and time every result against the message it covers."""
+    chunk = int(args.interval * SAMPLE_RATE)
+    sent_at: Dict[int, float] = {}
+    latencies, timings = [], []
+    messages = 0
+
+    async with websockets.connect(url, max_size=None) as ws:
+        async def receive():
+            async for raw in ws:
+                received = time.perf_counter()
+                result = json.loads(raw)
+                if result.get("received") in sent_at:
+                    latencies.append(received - sent_at[result["received"]])
+                if "timing" in result:
+                    timings.append(result["timing"])
+
+        receiver = asyncio.create_task(receive())
+        start = time.perf_counter()
+        for seq, offset in enumerate(range(0, len(audio), chunk), 1):
+            if args.mode == "full":
+                # Like the original widget: the whole recording so far, every time
+                payload = to_wav(audio[:offset + chunk])
+            elif args.encoding == "pcm16":
+                payload = to_pcm16(audio[offset:offset + chunk])
+            else:
+                payload = to_wav(audio[offset:offset + chunk])
+            # Pace like a live microphone: a message every `interval` seconds
+            await asyncio.sleep(max(0.0, start + seq * args.interval - time.perf_counter()))
+            sent_at[seq] = time.perf_counter()
+            await ws.send(payload)
+            messages += 1
+        await asyncio.sleep(args.drain)
+        receiver.cancel()
+
+    return {"latencies": latencies, "timings": timings, "messages": messages, "audio_seconds": len(audio) / SAMPLE_RATE}
+
+
+async def run_level(port: int, fixtures: List[np.ndarray], concurrency: int, args) -> Dict:
+    from app import metrics
+
+    # WAV clips go through the same container decoding path as webm
+    query = f"mode={args.mode}&timings=1" + ("&encoding=pcm16" if args.mode == "stream" and args.encoding == "pcm16" else "")
+    url = f"ws://127.0.0.1:{port}/listen?{query}"
+    inference_before = metrics.inference_seconds.total()
+    audio_before = metrics.audio_seconds_received.value()
+    superseded_before = metrics.messages_superseded.value()
+
+    start = time.perf_counter()
+    clients = await asyncio.gather(*[
+        run_client(url, fixtures[index % len(fixtures)], args) for index in range(concurrency)
+    ])
+    wall = time.perf_counter() - start
+
+    latencies = [latency for client in clients for latency in client["latencies"]]
+    timings = [timing for client in clients for timing in client["timings"]]
+    audio_seconds = metrics.audio_seconds_received.value() - audio_before
+    inference = metrics.inference_seconds.total() - inference_before
+    return {
+        "concurrency": concurrency,
+        "results": len(latencies),
+        "messages": sum(client["messages"] for client in clients),
+        "superseded": metrics.messages_superseded.value() - superseded_before,
+        "latency_ms": {
+            "p50": percentile(latencies, 50, 1000),
+            "p95": percentile(latencies, 95, 1000),
+            "p99": percentile(latencies, 99, 1000),
+            "mean": statistics.fmean(latencies) * 1000 if latencies else None,
+        },
+        "stage_ms": {
+            stage: percentile([timing[stage] for timing in timings], 50)
+            for stage in ("decode_ms", "queue_ms", "inference_ms")
+        },
+        "mean_batch_size": statistics.fmean(timing["batch_size"] for timing in timings) if timings else None,
+        # Inference time per second of received audio, across all sessions
+        "rtf": inference / audio_seconds if audio_seconds else None,
+        # Seconds of audio ingested per wall-clock second
+        "throughput": audio_seconds / wall,
+        "wall_seconds": wall,
+    }
+
+
+def print_level(result: Dict):
+    latency = result["latency_ms"]
+    fmt = lambda value: f"{value:8.0f}" if value is not None else "       -"
+    rtf = f"{result['rtf']:.3f}" if result["rtf"] is not None else "-"
+    print(
+        f"clients={result['concurrency']:3d}  p50={fmt(latency['p50'])}ms  p95={fmt(latency['p95'])}ms  "
+        f"p99={fmt(latency['p99'])}ms  rtf={rtf}  throughput={result['throughput']:.2f} audio-s/s  "
+        f"superseded={result['superseded']:.0f}"
+    )
+
+
+async def main(args):
+    fixtures = load_fixtures(args.fixtures)
+    if args.max_seconds:
+        fixtures = [audio[:int(args.max_seconds * SAMPLE_RATE)] for audio in fixtures]
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    from app import main as service
+
+    port = free_port()
+    results = []
+    with InProcessServer(service.app, port):
+        # The model loads in the background after boot
+        while service.model_status != "ready":
+            if service.model_status == "failed":
+                raise SystemExit("The model failed to load")
+            await asyncio.sleep(0.5)
+        for concurrency in levels:
+            result = await run_level(port, fixtures, concurrency, args)
+            print_level(result)
+            results.append(result)
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "revision": git_revision(),
+        "host": {"platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "config": {
+            "mode": args.mode,
+            "encoding": args.encoding,
+            "interval": args.interval,
+            "fixtures": args.fixtures,
+            "max_seconds": args.max_seconds,
+            "env": {key: value for key, value in os.environ.items() if key.startswith("WHISPER_")},
+        },
+        "levels": results,
+    }
+    output = Path(args.output or f"bench/results/listen-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fixtures", nargs="+", default=["bench/fixtures"], help="Audio files or directories to replay")
+    parser.add_argument("--concurrency", default="1,2,4", help="Comma separated numbers of concurrent clients")
+    parser.add_argument("--mode", choices=["stream", "full"], default="stream")
+    parser.add_argument("--encoding", choices=["pcm16", "wav"], default="pcm16", help="Message format in stream mode")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between messages, like the recorder widget")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Only replay the first N seconds of each fixture")
+    parser.add_argument("--drain", type=float, default=5.0, help="Seconds to wait for results after the last message")
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,81 @@
+import numpy as np
+
+from app.audio import SAMPLE_RATE, AudioRingBuffer
+
+
+def pcm16(*samples) -> bytes:
+    return np.array(samples, dtype="<i2").tobytes()
+
+
+def ramp(start: int, stop: int) -> np.ndarray:
+    return np.arange(start, stop, dtype=np.float32)
+
+
+def small_buffer(samples: int) -> AudioRingBuffer:
+    return AudioRingBuffer(capacity_seconds=samples / SAMPLE_RATE)
+
+
+def test_reads_back_what_was_written():
+    buffer = small_buffer(8)
+    buffer.write(ramp(0, 5))
+    assert len(buffer) == 5
+    assert buffer.read().tolist() == [0, 1, 2, 3, 4]
+
+
+def test_wraps_around_and_overwrites_the_oldest_samples():
+    buffer = small_buffer(8)
+    buffer.write(ramp(0, 6))
+    buffer.write(ramp(6, 11))
+    assert (buffer.start, buffer.end) == (3, 11)
+    assert buffer.read().tolist() == [3, 4, 5, 6, 7, 8, 9, 10]
+
+
+def test_a_write_larger_than_the_capacity_keeps_its_newest_samples():
+    buffer = small_buffer(4)
+    buffer.write(ramp(0, 10))
+    assert (buffer.start, buffer.end) == (6, 10)
+    assert buffer.read().tolist() == [6, 7, 8, 9]
+
+
+def test_discard_until_drops_older_samples_across_the_wrap():
+    buffer = small_buffer(8)
+    buffer.write(ramp(0, 6))
+    buffer.write(ramp(6, 11))
+    buffer.discard_until(9)
+    assert buffer.read().tolist() == [9, 10]
+
+
+def test_discard_until_never_moves_backwards_or_past_the_end():
+    buffer = small_buffer(8)
+    buffer.write(ramp(0, 6))
+    buffer.discard_until(4)
+    buffer.discard_until(2)
+    assert buffer.start == 4
+    buffer.discard_until(100)
+    assert buffer.start == buffer.end == 6
+    assert len(buffer.read()) == 0
+
+
+def test_read_copies_once_less_than_the_headroom_is_free():
+    buffer = small_buffer(8)
+    buffer.write(ramp(0, 3))
+    assert np.shares_memory(buffer.read(headroom=4), buffer._data)
+    buffer.write(ramp(3, 6))
+    window = buffer.read(headroom=4)
+    buffer.write(ramp(6, 10))
+    assert window.tolist() == [0, 1, 2, 3, 4, 5]
+
+
+def test_pcm16_is_scaled_to_float32():
+    buffer = small_buffer(8)
+    buffer.write_pcm16(pcm16(0, 16384, -32768))
+    assert buffer.read().dtype == np.float32
+    assert buffer.read().tolist() == [0.0, 0.5, -1.0]
+
+
+def test_pcm16_frames_may_split_a_sample():
+    samples = pcm16(1000, -2000, 3000, 32767)
+    buffer = small_buffer(8)
+    for frame in (samples[:3], samples[3:4], samples[4:7], samples[7:]):
+        buffer.write_pcm16(frame)
+    assert (buffer.read() * 32768).tolist() == [1000, -2000, 3000, 32767]
@@ -0,0 +1,56 @@
+from app.delta import SegmentTracker
+from app.streaming import Word
+
+
+def words(*texts) -> list:
+    return [Word(text, index, index + 0.5) for index, text in enumerate(texts)]
+
+
+def test_a_new_tail_is_sent_as_new():
+    tracker = SegmentTracker()
+    assert tracker.update([], words("I", "cast")) == [{"id": 0, "status": "new", "text": "I cast"}]
+
+
+def test_an_unchanged_tail_is_not_sent_again():
+    tracker = SegmentTracker()
+    tracker.update([], words("I", "cast"))
+    assert tracker.update([], words("I", "cast")) == []
+
+
+def test_a_changed_tail_is_sent_as_revised():
+    tracker = SegmentTracker()
+    tracker.update([], words("I", "cast"))
+    assert tracker.update([], words("I", "cast", "ice")) == [{"id": 0, "status": "revised", "text": "I cast ice"}]
+
+
+def test_committed_words_finalize_the_segment_and_open_the_next_one():
+    tracker = SegmentTracker()
+    tracker.update([], words("I", "cast"))
+    committed = words("I", "cast")
+    deltas = tracker.update(committed, words("ice"))
+    assert deltas == [
+        {"id": 0, "status": "final", "text": "I cast", "words": [word.to_json() for word in committed]},
+        {"id": 1, "status": "new", "text": "ice"},
+    ]
+
+
+def test_every_segment_is_finalized_exactly_once():
+    tracker = SegmentTracker()
+    finals = []
+    ticks = [
+        ([], words("roll")),
+        (words("roll"), words("for")),
+        ([], words("for")),
+        (words("for"), []),
+        ([], []),
+        (words("initiative"), []),
+    ]
+    for committed, pending in ticks:
+        finals += [delta["id"] for delta in tracker.update(committed, pending) if delta["status"] == "final"]
+    assert finals == [0, 1, 2]
+
+
+def test_a_tail_that_disappears_is_revised_to_empty():
+    tracker = SegmentTracker()
+    tracker.update([], words("uh"))
+    assert tracker.update([], []) == [{"id": 0, "status": "revised", "text": ""}]
@@ -0,0 +1,107 @@
+import numpy as np
+
+from app.audio import SAMPLE_RATE
+from app.streaming import StreamingTranscriber, Word
+
+
+def silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def words(*spec) -> list:
+    return [Word(text, start, end) for text, start, end in spec]
+
+
+def texts(result) -> list:
+    return [word.text for word in result]
+
+
+def test_words_are_committed_once_two_passes_agree():
+    transcriber = StreamingTranscriber()
+    transcriber.append(silence(2))
+    first = words(("roll", 0.0, 0.4), ("for", 0.5, 0.7), ("initiative", 0.8, 1.5))
+    assert transcriber.update(first, 2.0) == []
+    assert texts(transcriber.pending()) == ["roll", "for", "initiative"]
+
+    transcriber.append(silence(1))
+    second = words(("Roll", 0.0, 0.4), ("for", 0.5, 0.7), ("initiative.", 0.8, 1.5), ("now", 2.2, 2.5))
+    assert texts(transcriber.update(second, 3.0)) == ["Roll", "for", "initiative."]
+    assert texts(transcriber.pending()) == ["now"]
+    assert transcriber.committed_until == 1.5
+
+
+def test_agreement_stops_at_the_first_disagreement():
+    transcriber = StreamingTranscriber()
+    transcriber.append(silence(2))
+    transcriber.update(words(("the", 0.0, 0.2), ("ogre", 0.3, 0.6), ("charges", 0.7, 1.2)), 2.0)
+    committed = transcriber.update(words(("the", 0.0, 0.2), ("orc", 0.3, 0.6), ("charges", 0.7, 1.2)), 2.0)
+    assert texts(committed) == ["the"]
+    assert texts(transcriber.pending()) == ["orc", "charges"]
+
+
+def test_repeated_words_at_the_seam_are_not_committed_twice():
+    transcriber = StreamingTranscriber(overlap=1.0)
+    transcriber.append(silence(3))
+    spoken = words(("cast", 0.0, 0.4), ("misty", 0.5, 0.9), ("step", 1.0, 1.4))
+    transcriber.update(spoken, 3.0)
+    transcriber.update(spoken, 3.0)
+
+    # The overlap is re-transcribed with slightly shifted times
+    again = words(("step", 1.45, 1.8), ("now", 2.0, 2.3))
+    transcriber.update(again, 3.0)
+    assert texts(transcriber.update(again, 3.0)) == ["now"]
+
+
+def test_unstable_words_are_forced_out_once_the_window_is_too_long():
+    transcriber = StreamingTranscriber(overlap=1.0, max_window=5.0)
+    transcriber.append(silence(4))
+    transcriber.update(words(("a", 0.0, 1.0), ("b", 2.0, 3.0)), 4.0)
+    transcriber.append(silence(2))
+    # Nothing agrees, but everything ending before window_end - overlap is committed
+    committed = transcriber.update(words(("x", 0.0, 1.0), ("y", 2.0, 3.0), ("z", 4.5, 5.5)), 6.0)
+    assert texts(committed) == ["x", "y"]
+    assert texts(transcriber.pending()) == ["z"]
+
+
+def test_committed_audio_is_trimmed_down_to_the_overlap():
+    transcriber = StreamingTranscriber(overlap=1.0)
+    transcriber.append(silence(6))
+    spoken = words(("hold", 0.0, 1.0), ("person", 3.0, 4.0), ("fails", 5.0, 5.8))
+    transcriber.update(spoken, 6.0)
+    transcriber.update(spoken[:2] + words(("succeeds", 5.0, 5.8)), 6.0)
+    assert transcriber.audio_offset == 3.0
+
+
+def test_silence_keeps_only_a_short_tail():
+    transcriber = StreamingTranscriber(silence_keep=3.0)
+    transcriber.append(silence(10))
+    assert transcriber.update([], 10.0) == []
+    assert transcriber.audio_offset == 7.0
+    assert len(transcriber.window()[0]) == 3 * SAMPLE_RATE
+
+
+def test_audio_after_the_transcribed_window_is_never_trimmed():
+    transcriber = StreamingTranscriber(silence_keep=3.0)
+    transcriber.append(silence(2))
+    audio, offset = transcriber.window()
+    # Speech arrives while the silent window is transcribed
+    transcriber.append(silence(6))
+    transcriber.update([], offset + len(audio) / SAMPLE_RATE)
+    assert transcriber.audio_offset == 0.0
+    assert transcriber.buffer_end == 8.0
+
+
+def test_a_window_near_the_buffer_capacity_is_copied():
+    transcriber = StreamingTranscriber(max_window=20.0)
+    transcriber.append(np.ones(45 * SAMPLE_RATE, dtype=np.float32))
+    audio, _ = transcriber.window()
+    transcriber.append(np.full(20 * SAMPLE_RATE, 2.0, dtype=np.float32))
+    assert len(audio) == 45 * SAMPLE_RATE
+    assert np.all(audio == 1.0)
+
+
+def test_a_short_window_is_a_view():
+    transcriber = StreamingTranscriber(max_window=20.0)
+    transcriber.append(np.ones(5 * SAMPLE_RATE, dtype=np.float32))
+    audio, _ = transcriber.window()
+    assert np.shares_memory(audio, transcriber.buffer._data)
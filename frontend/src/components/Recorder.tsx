@@ -5,30 +5,45 @@ import {config} from '../config.ts';
 // Define the type for recording status for clarity
 type RecordingStatus = 'idle' | 'permission-pending' | 'recording' | 'stopped' | 'error';
 
-const WEBSOCKET_URL = `wss://${location.host}/whisper/listen`;
-const CHUNK_DURATION = 3000; // 3 seconds
+const WEBSOCKET_URL = `wss://${location.host}/whisper/listen?mode=stream`;
+const SEND_INTERVAL = 2000; // 2 seconds
+const LAG_WARNING_THRESHOLD = 5000; // 5 seconds
 
-type Transcription = {
-    type: 'transcription';
-    segments: [{
-        text: string;
-        words: [{
-            word: string;
-            start: number;
-            end: number;
-        }];
+type SegmentDelta = {
+    // Stable across messages: a segment is sent as 'new', then 'revised' zero or more times, then 'final' exactly once
+    id: number;
+    status: 'new' | 'revised' | 'final';
+    text: string;
+    // Only present on final segments
+    words?: [{
+        word: string;
+        start: number;
+        end: number;
     }];
 }
 
+type TranscriptionDelta = {
+    type: 'delta';
+    // Only the segments that are new, changed or finalized since the previous message
+    segments: SegmentDelta[];
+    tier: string;
+    // Number of clips the server has received, and how many ticks it skipped to catch up
+    received: number;
+    dropped: number;
+    // How long the newest audio in this result waited on the server
+    lag_ms: number;
+}
+
 export const FloatingRecorderWidget = () => {
     const [status, setStatus] = useState<RecordingStatus>('idle');
     const [error, setError] = useState<string | null>(null);
+    const [lagMs, setLagMs] = useState<number>(0);
 
     const socketRef = useRef<WebSocket | null>(null);
     const mediaRecorderRef = useRef<MediaRecorder | null>(null);
     const audioStreamRef = useRef<MediaStream | null>(null);
-    const audioChunks = useRef<Blob[] | null>([]);
     const sendIntervalRef = useRef<number | null>(null);
+    const forwardedSegmentIds = useRef<Set<number>>(new Set());
 
     useEffect(() => {
         // Standard cleanup on component unmount
@@ -48,6 +63,7 @@ export const FloatingRecorderWidget = () => {
     const startRecording = () => {
         setError(null);
         setStatus('permission-pending');
+        forwardedSegmentIds.current = new Set();
         socketRef.current = new WebSocket(WEBSOCKET_URL);
         console.log("Attempting to connect WebSocket...");
         socketRef.current.onopen = async () => {
@@ -57,23 +73,27 @@ export const FloatingRecorderWidget = () => {
                 audioStreamRef.current = stream;
                 setStatus('recording');
 
-                mediaRecorderRef.current = new MediaRecorder(stream, { mimeType: 'audio/webm' });
-
-                mediaRecorderRef.current.ondataavailable = async (event) => {
-                    if (event.data.size > 0 && socketRef.current?.readyState === WebSocket.OPEN) {
-                        audioChunks.current?.push(event.data);
-                    }
-                };
-
-                mediaRecorderRef.current.onstop = () => {
-                    console.log("MediaRecorder stopped.");
+                // Every clip is recorded by its own MediaRecorder so that each blob
+                // is a self-contained webm file holding only the new audio.
+                const startClip = () => {
+                    const recorder = new MediaRecorder(stream, { mimeType: 'audio/webm' });
+                    recorder.ondataavailable = (event) => {
+                        if (event.data.size > 0 && socketRef.current?.readyState === WebSocket.OPEN) {
+                            console.log(`-> Sending audio clip of size ${event.data.size}`);
+                            socketRef.current.send(event.data);
+                        }
+                    };
+                    recorder.onstop = () => {
+                        console.log("MediaRecorder stopped.");
+                    };
+                    recorder.start();
+                    mediaRecorderRef.current = recorder;
                 };
+                startClip();
                 sendIntervalRef.current = setInterval(() => {
-                    console.log(`-> Sending audio chunk of size ${audioChunks.current!.length}`);
-                    const audio = new Blob(audioChunks.current!, {type: 'audio/webm'});
-                    socketRef?.current?.send(audio);
-                }, 2000);
-                mediaRecorderRef.current.start(CHUNK_DURATION);
+                    mediaRecorderRef.current?.stop();
+                    startClip();
+                }, SEND_INTERVAL);
             } catch (err) {
                 console.error('Error getting microphone access:', err);
                 setError("Microphone access was denied.");
@@ -86,7 +106,17 @@ export const FloatingRecorderWidget = () => {
         };
         socketRef.current.onmessage = async (event) => {
             console.log('<- Received message from server:', event.data);
-            const trans = JSON.parse(event.data) as Transcription;
+            const trans = JSON.parse(event.data) as TranscriptionDelta;
+            setLagMs(trans.lag_ms ?? 0);
+            // Forward every finalized segment to the assistant exactly once
+            const finalized = trans.segments.filter(
+                segment => segment.status === 'final' && !forwardedSegmentIds.current.has(segment.id)
+            );
+            finalized.forEach(segment => forwardedSegmentIds.current.add(segment.id));
+            const wordsSpoken = finalized.map(segment => segment.text).join(' ');
+            if (!wordsSpoken) {
+                return;
+            }
             await fetch(config.assistantHttpUrl, {
                 method: 'POST',
                 headers: {
@@ -94,7 +124,7 @@ export const FloatingRecorderWidget = () => {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
-                    words_spoken: trans.segments.map(t => t.text).join(''),
+                    words_spoken: wordsSpoken,
                 }),
             });
         };
@@ -154,6 +184,12 @@ export const FloatingRecorderWidget = () => {
     // Main component render
     return (
                 <div className="fixed bottom-8 right-8 z-50 flex flex-col items-end gap-4">
+                 {status === 'recording' && lagMs > LAG_WARNING_THRESHOLD && (
+                    <div className="w-64 p-3 bg-yellow-900/80 backdrop-blur-sm text-yellow-200 rounded-lg flex items-center gap-2 text-sm border border-yellow-700 shadow-lg">
+                        <AlertTriangle size={18}/>
+                        <span>Transcription is {Math.round(lagMs / 1000)}s behind.</span>
+                    </div>
+                )}
                  {error && (
                     <div className="w-64 p-3 bg-red-900/80 backdrop-blur-sm text-red-200 rounded-lg flex items-center gap-2 text-sm border border-red-700 shadow-lg">
                         <AlertTriangle size={18}/>
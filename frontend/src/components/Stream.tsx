@@ -4,6 +4,13 @@ import { StatusIcon } from './StatusIcon';
 import { Section } from './Section';
 import {config} from '../config.ts';
 
+type TipField = 'relatedGameRule' | 'readThisTextToYourPlayers' | 'whatCouldHappenNext';
+
+// The assistant streams every tip as deltas with the text appended to each field,
+// then sends the complete tip once it is done
+type TipMessage =
+    | { type: 'delta'; tipId: number; fields: Partial<Record<TipField, string>> }
+    | ({ type: 'tip'; tipId: number; complete: true } & Record<TipField, string>);
 
 export const StreamerView = () => {
     const [readNext, setReadNext] = useState<string>('The ether remains silent...');
@@ -11,6 +18,7 @@ export const StreamerView = () => {
     const [happenNext, setHappenNext] = useState<string>('The threads of fate are unclear...');
     const [status, setStatus] = useState<SocketStatus>('connecting');
     const ws = useRef<WebSocket | null>(null);
+    const tipId = useRef<number | null>(null);
 
     useEffect(() => {
         const connect = () => {
@@ -28,10 +36,25 @@ export const StreamerView = () => {
             ws.current.onerror = () => setStatus('error');
             ws.current.onmessage = (event) => {
                 try {
-                    const data = JSON.parse(event.data);
-                    setReadNext(data.readThisTextToYourPlayers);
-                    setRelatedRules(data.relatedGameRule);
-                    setHappenNext(data.whatCouldHappenNext);
+                    const data = JSON.parse(event.data) as TipMessage;
+                    if (data.type === 'tip') {
+                        tipId.current = data.tipId;
+                        setReadNext(data.readThisTextToYourPlayers);
+                        setRelatedRules(data.relatedGameRule);
+                        setHappenNext(data.whatCouldHappenNext);
+                        return;
+                    }
+                    if (data.tipId !== tipId.current) {
+                        // A new tip replaces the previous one
+                        tipId.current = data.tipId;
+                        setReadNext('');
+                        setRelatedRules('');
+                        setHappenNext('');
+                    }
+                    const { relatedGameRule, readThisTextToYourPlayers, whatCouldHappenNext } = data.fields;
+                    if (readThisTextToYourPlayers) setReadNext(text => text + readThisTextToYourPlayers);
+                    if (relatedGameRule) setRelatedRules(text => text + relatedGameRule);
+                    if (whatCouldHappenNext) setHappenNext(text => text + whatCouldHappenNext);
                 } catch (error) {
                     console.error("Failed to parse incoming JSON:", error);
                     setReadNext("A garbled message was received from the beyond.");
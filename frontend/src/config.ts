@@ -1,4 +1,7 @@
+// Devices opened with the same ?session=<id> share one game table, each table gets its own tips
+const sessionId = encodeURIComponent(new URLSearchParams(location.search).get('session') ?? 'default');
+
 export const config = {
-    assistantHttpUrl: `${location.protocol}//${location.host}/assistant/`,
-    assistantWsUrl: `${location.protocol === 'http:' ? 'ws:' : 'wss:'}//${location.host}/assistant/ws`,
+    assistantHttpUrl: `${location.protocol}//${location.host}/assistant/?session_id=${sessionId}`,
+    assistantWsUrl: `${location.protocol === 'http:' ? 'ws:' : 'wss:'}//${location.host}/assistant/ws?session_id=${sessionId}`,
 }
@@ -0,0 +1,289 @@
+"""
+End-to-end latency benchmark of the assistant's tip pipeline.
+
+Starts the mock Mistral server and the assistant in-process, then replays a
+recorded transcript line by line to POST /assistant/ while subscribers listen
+on /assistant/ws. For every number of subscribers it reports the latency from
+the last words a tip covers to its first streamed text and to the complete
+tip as seen by the subscribers, the time spent parsing the stream, and how
+long the complete tip takes to fan out to all subscribers, and writes all
+results to a JSON file so runs can be compared over time.
+
+Run from the mistral-client directory:
+
+    uv run python -m bench.assistant_bench --subscribers 1,8,64 --first-token-ms 400 --tokens-per-second 60
+
+Talk is batched into tips by TALK_DEBOUNCE_MS and TALK_MAX_WAIT_MS, set them
+to compare scheduling settings. Lookups of rulebook passages need Chroma and
+are off unless PREFETCH_ENABLED=1 is set.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+import numpy as np
+import uvicorn
+import websockets
+
+from bench.mock_mistral import DEFAULT_TIPS, create_app, load_tips
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+ENV_PREFIXES = ("TALK_", "TIP_", "SUBSCRIBER_", "CONTEXT_", "PREFETCH_")
+
+
+def load_transcript(paths: List[str]) -> List[str]:
+    lines = []
+    for path in paths:
+        lines.extend(line.strip() for line in Path(path).read_text().splitlines() if line.strip())
+    if not lines:
+        raise SystemExit(f"No talk found in {paths}")
+    return lines
+
+
+def percentiles(values: List[float], scale: float = 1000.0) -> Dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    return {
+        "p50": float(np.percentile(values, 50)) * scale,
+        "p95": float(np.percentile(values, 95)) * scale,
+        "p99": float(np.percentile(values, 99)) * scale,
+        "mean": statistics.fmean(values) * scale,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+class InProcessServer:
+    """Runs the app with uvicorn in a background thread of this process."""
+
+    def __init__(self, app, port: int):
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+async def run_subscriber(url: str, connected: asyncio.Event, received: Dict[int, Dict]):
+    """Record when the first text and the complete tip of every tip arrive."""
+    async with websockets.connect(url, max_size=None) as ws:
+        connected.set()
+        async for raw in ws:
+            arrived = time.perf_counter()
+            message = json.loads(raw)
+            tip = received.setdefault(message["tipId"], {"first": arrived, "complete": None})
+            if message.get("type") == "tip":
+                tip["complete"] = arrived
+
+
+async def run_session(port: int, session_id: str, lines: List[str], subscribers: int, args) -> Dict:
+    url = f"ws://127.0.0.1:{port}/assistant/ws?session_id={session_id}"
+    received = [{} for _ in range(subscribers)]
+    connected = [asyncio.Event() for _ in range(subscribers)]
+    listeners = [asyncio.create_task(run_subscriber(url, connected[index], received[index])) for index in range(subscribers)]
+    await asyncio.wait_for(asyncio.gather(*(event.wait() for event in connected)), 30)
+    # The server registers a subscriber right after the handshake
+    await asyncio.sleep(0.1)
+
+    posted = []
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as http:
+        start = time.perf_counter()
+        for seq, line in enumerate(lines):
+            # Pace like the recorder: a transcript line every `interval` seconds
+            await asyncio.sleep(max(0.0, start + seq * args.interval - time.perf_counter()))
+            posted.append((line, time.perf_counter()))
+            await http.post("/assistant/", params={"session_id": session_id}, json={"words_spoken": line})
+    await asyncio.sleep(args.drain)
+    for listener in listeners:
+        listener.cancel()
+    await asyncio.gather(*listeners, return_exceptions=True)
+    return {"posted": posted, "received": received}
+
+
+async def run_level(port: int, lines: List[str], subscribers: int, tip_timings: List[Dict], args) -> Dict:
+    session_ids = [f"bench-{subscribers}-{index}" for index in range(args.sessions)]
+    start = time.perf_counter()
+    sessions = await asyncio.gather(*[
+        run_session(port, session_id, lines, subscribers, args) for session_id in session_ids
+    ])
+    wall = time.perf_counter() - start
+
+    first_latencies, complete_latencies, fanout, fanout_spread = [], [], [], []
+    generation, scheduling, parse, parse_share, broadcast = [], [], [], [], []
+    tips = cancelled = 0
+    for session_id, session in zip(session_ids, sessions):
+        for timing in [timing for timing in tip_timings if timing["session_id"] == session_id]:
+            # The latency of a tip counts from the last words it covers
+            covered = [posted_at for line, posted_at in session["posted"] if posted_at <= timing["started"] and line in timing["talk"]]
+            if not covered or timing["first_token"] is None:
+                continue
+            last_talk = max(covered)
+            tips += 1
+            scheduling.append(timing["started"] - last_talk)
+            generation.append(timing["first_token"] - timing["started"])
+            parse.append(timing["parse_seconds"])
+            parse_share.append(timing["parse_seconds"] / max(timing["completed"] - timing["first_token"], 1e-9))
+            broadcast.append(timing["broadcast_seconds"])
+            arrivals = []
+            for received in session["received"]:
+                tip = received.get(timing["tip_id"])
+                if tip is None or tip["complete"] is None:
+                    continue
+                first_latencies.append(tip["first"] - last_talk)
+                complete_latencies.append(tip["complete"] - last_talk)
+                arrivals.append(tip["complete"] - timing["completed"])
+            fanout.extend(arrivals)
+            if arrivals:
+                fanout_spread.append(max(arrivals))
+        # Tips that streamed but never completed were cancelled by newer talk
+        started_tips = {tip_id for received in session["received"] for tip_id in received}
+        completed_tips = {tip_id for received in session["received"] for tip_id, tip in received.items() if tip["complete"]}
+        cancelled += len(started_tips - completed_tips)
+
+    return {
+        "subscribers": subscribers,
+        "sessions": args.sessions,
+        "talk_lines": len(lines) * args.sessions,
+        "tips": tips,
+        "cancelled": cancelled,
+        # Last words of a tip to its first text and to the complete tip, per subscriber
+        "talk_to_first_token_ms": percentiles(first_latencies),
+        "talk_to_complete_tip_ms": percentiles(complete_latencies),
+        # Last words of a tip until its generation starts, i.e. debouncing and queueing
+        "scheduling_ms": percentiles(scheduling),
+        # Generation start to the first token, including context and agent requests
+        "time_to_first_token_ms": percentiles(generation),
+        "parse_ms_per_tip": percentiles(parse),
+        # Parsing time relative to the time the tip streamed for
+        "parse_share": statistics.fmean(parse_share) if parse_share else None,
+        "broadcast_ms_per_tip": percentiles(broadcast),
+        # From broadcasting a complete tip to each subscriber, and to the last subscriber
+        "fanout_ms": percentiles(fanout),
+        "fanout_to_all_ms": percentiles(fanout_spread),
+        "wall_seconds": wall,
+    }
+
+
+def print_level(result: Dict):
+    fmt = lambda value: f"{value:7.1f}" if value is not None else "      -"
+    print(
+        f"subscribers={result['subscribers']:4d}  tips={result['tips']:3d}  "
+        f"first token p50={fmt(result['talk_to_first_token_ms']['p50'])}ms p95={fmt(result['talk_to_first_token_ms']['p95'])}ms  "
+        f"complete p50={fmt(result['talk_to_complete_tip_ms']['p50'])}ms  "
+        f"parse p50={fmt(result['parse_ms_per_tip']['p50'])}ms  "
+        f"fan-out to all p50={fmt(result['fanout_to_all_ms']['p50'])}ms p95={fmt(result['fanout_to_all_ms']['p95'])}ms"
+    )
+
+
+async def main(args):
+    lines = load_transcript(args.transcripts)
+    if args.max_lines:
+        lines = lines[:args.max_lines]
+    levels = [int(level) for level in args.subscribers.split(",")]
+
+    mock_port, port = free_port(), free_port()
+    # The assistant reads its configuration at import time
+    os.environ.setdefault("MISTRAL_API_KEY", "mock")
+    os.environ["MISTRAL_SERVER_URL"] = args.mistral_url or f"http://127.0.0.1:{mock_port}"
+    os.environ["INGEST_WORKER_EMBEDDED"] = "0"
+    os.environ.setdefault("PREFETCH_ENABLED", "0")
+    state_dir = tempfile.TemporaryDirectory()
+    # Don't overwrite the agent of the real deployment
+    os.environ["AGENT_STATE_PATH"] = os.path.join(state_dir.name, "agent.json")
+    os.environ["INGEST_DB_PATH"] = os.path.join(state_dir.name, "ingest_jobs.db")
+
+    import client as service
+
+    # Filled from the server thread as tips finish
+    tip_timings: List[Dict] = []
+    service.tip_observers.append(tip_timings.append)
+
+    mock = None if args.mistral_url else create_app(load_tips(args.tips), args.first_token_ms, args.tokens_per_second, args.tokens_per_chunk)
+    results = []
+    with InProcessServer(mock, mock_port) if not args.mistral_url else contextlib.nullcontext(), InProcessServer(service.app, port):
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as http:
+            while (await http.get("/assistant/ready")).status_code != 200:
+                await asyncio.sleep(0.1)
+        for subscribers in levels:
+            result = await run_level(port, lines, subscribers, tip_timings, args)
+            print_level(result)
+            results.append(result)
+    state_dir.cleanup()
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "revision": git_revision(),
+        "host": {"platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "config": {
+            "transcripts": args.transcripts,
+            "talk_lines": len(lines),
+            "interval": args.interval,
+            "sessions": args.sessions,
+            "mock": None if args.mistral_url else {
+                "tips": args.tips,
+                "first_token_ms": args.first_token_ms,
+                "tokens_per_second": args.tokens_per_second,
+                "tokens_per_chunk": args.tokens_per_chunk,
+            },
+            "env": {key: value for key, value in os.environ.items() if key.startswith(ENV_PREFIXES)},
+        },
+        "levels": results,
+    }
+    output = Path(args.output or f"bench/results/assistant-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--transcripts", nargs="+", default=["bench/transcript.txt"], help="Text files with one line of talk per line")
+    parser.add_argument("--subscribers", default="1,8,64", help="Comma separated numbers of subscribers per session")
+    parser.add_argument("--sessions", type=int, default=1, help="Sessions replaying the transcript at the same time")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between lines of talk")
+    parser.add_argument("--max-lines", type=int, default=None, help="Only replay the first N lines")
+    parser.add_argument("--drain", type=float, default=15.0, help="Seconds to wait for tips after the last line")
+    parser.add_argument("--tips", default=str(DEFAULT_TIPS), help="YAML file with one canned tip per document")
+    parser.add_argument("--first-token-ms", type=float, default=400, help="Time to first token of the mock")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="Token rate of the mock")
+    parser.add_argument("--tokens-per-chunk", type=int, default=1, help="Tokens per streamed event of the mock")
+    parser.add_argument("--mistral-url", default=None, help="Use this Mistral API instead of the mock, e.g. https://api.mistral.ai")
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
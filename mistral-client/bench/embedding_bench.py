@@ -0,0 +1,143 @@
+"""
+Throughput and recall benchmark of the embedding backends.
+
+Embeds the pages of a sample rulebook with every backend, then runs the
+bundled rule lookups against each backend's embeddings. Reports pages per
+second, query latency, and recall@k against the first backend (normally the
+full precision model), and writes all results to a JSON file so runs can be
+compared over time.
+
+Run from the mistral-client directory:
+
+    uv run python -m bench.embedding_bench --pdf rulebook.pdf --backends torch,torch-int8,onnx
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from embedding_backends import EMBEDDING_MODEL, create_embedding_function  # noqa: E402
+from pdf_pages import count_pages, extract_page_range  # noqa: E402
+
+
+def load_pages(pdf_path: str, max_pages: int) -> List[str]:
+    total = count_pages(pdf_path)
+    return [text for _, text in extract_page_range(pdf_path, 0, min(total, max_pages) if max_pages else total)]
+
+
+def top_k(query_embeddings: np.ndarray, page_embeddings: np.ndarray, k: int) -> List[List[int]]:
+    # Embeddings are normalized, so the dot product is the cosine similarity
+    scores = query_embeddings @ page_embeddings.T
+    return [list(np.argsort(-row)[:k]) for row in scores]
+
+
+def run_backend(spec: str, pages: List[str], queries: List[str], args) -> Dict:
+    backend, _, onnx_file = spec.partition(":")
+    overrides = {"backend": backend, "batch_size": args.batch_size, "threads": args.threads, "dimensions": args.dimensions}
+    if onnx_file:
+        overrides["onnx_file"] = onnx_file
+    if args.model:
+        overrides["model_name"] = args.model
+
+    start = time.perf_counter()
+    embed = create_embedding_function(**overrides)
+    load_seconds = time.perf_counter() - start
+    embed(["warmup"])
+
+    start = time.perf_counter()
+    page_embeddings = np.asarray(embed(pages))
+    ingest_seconds = time.perf_counter() - start
+
+    latencies = []
+    query_embeddings = []
+    for query in queries:
+        start = time.perf_counter()
+        query_embeddings.append(embed([query])[0])
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "backend": spec,
+        "dimensions": int(page_embeddings.shape[1]),
+        "load_seconds": load_seconds,
+        "pages_per_second": len(pages) / ingest_seconds,
+        "query_ms": {
+            "p50": float(np.percentile(latencies, 50)) * 1000,
+            "p95": float(np.percentile(latencies, 95)) * 1000,
+            "mean": statistics.fmean(latencies) * 1000,
+        },
+        "top_k": top_k(np.asarray(query_embeddings), page_embeddings, args.k),
+    }
+
+
+def main(args):
+    pages = load_pages(args.pdf, args.max_pages)
+    queries = [line.strip() for line in Path(args.queries).read_text().splitlines() if line.strip()]
+    if len(pages) < args.k:
+        raise SystemExit(f"The PDF has {len(pages)} pages with text, need at least k={args.k}")
+
+    results = []
+    for spec in args.backends.split(","):
+        result = run_backend(spec, pages, queries, args)
+        results.append(result)
+
+    # The first backend is the reference the others are compared with
+    reference = results[0]["top_k"]
+    for result in results:
+        result["recall_at_k"] = statistics.fmean(
+            len(set(found) & set(expected)) / args.k for found, expected in zip(result["top_k"], reference)
+        )
+        result["top_k"] = [[int(index) for index in found] for found in result["top_k"]]
+        print(
+            f"{result['backend']:24s} dim={result['dimensions']:5d}  pages/s={result['pages_per_second']:8.2f}  "
+            f"query p50={result['query_ms']['p50']:7.1f}ms  recall@{args.k}={result['recall_at_k']:.3f}"
+        )
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "host": {"platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "config": {
+            "pdf": args.pdf,
+            "pages": len(pages),
+            "queries": len(queries),
+            "model": args.model or EMBEDDING_MODEL,
+            "k": args.k,
+            "batch_size": args.batch_size,
+            "threads": args.threads,
+            "dimensions": args.dimensions,
+        },
+        "backends": results,
+    }
+    output = Path(args.output or f"bench/results/embedding-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pdf", required=True, help="Sample rulebook to embed")
+    parser.add_argument("--backends", default="torch,torch-int8",
+                        help="Comma separated backends, the first is the reference. Use onnx:<file> to pick an ONNX export")
+    parser.add_argument("--queries", default=str(Path(__file__).parent / "queries.txt"), help="One query per line")
+    parser.add_argument("--model", default=None, help="Model to load instead of EMBEDDING_MODEL")
+    parser.add_argument("--k", type=int, default=5, help="Pages retrieved per query for recall@k")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0, help="Inference threads, 0 for the runtime's default")
+    parser.add_argument("--dimensions", type=int, default=0, help="Matryoshka truncation, 0 for all dimensions")
+    parser.add_argument("--max-pages", type=int, default=0, help="Only embed the first N pages")
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,177 @@
+"""
+Local stand-in for the Mistral API that streams canned tips.
+
+Serves the endpoints the assistant uses: agents, streamed conversations and
+chat completions (for the running summary). Every conversation turn streams
+the next tip of a YAML file with one tip per document, after a configurable
+time to first token and at a configurable token rate, so the assistant's
+pipeline can be measured without the live API.
+
+Run from the mistral-client directory:
+
+    uv run python -m bench.mock_mistral --port 8882 --first-token-ms 400 --tokens-per-second 60
+
+and point the assistant at it with MISTRAL_SERVER_URL=http://127.0.0.1:8882 and any MISTRAL_API_KEY.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import re
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_TIPS = Path(__file__).resolve().parent / "tips.yaml"
+
+# A word with the whitespace after it is close enough to a token
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+def load_tips(path: str) -> List[str]:
+    """The raw YAML of every document in `path`, streamed as written."""
+    tips = [tip.strip("\n") + "\n" for tip in re.split(r"^---\s*$", Path(path).read_text(), flags=re.MULTILINE)]
+    return [tip for tip in tips if tip.strip()]
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text)
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def sse(data: Dict) -> str:
+    return f"event: {data['type']}\ndata: {json.dumps(data)}\n\n"
+
+
+def create_app(
+    tips: List[str],
+    first_token_ms: float = 400,
+    tokens_per_second: float = 60,
+    tokens_per_chunk: int = 1,
+    model: str = "mistral-small-2503",
+) -> FastAPI:
+    app = FastAPI()
+    agents: Dict[str, Dict] = {}
+    next_tip = itertools.cycle(tips)
+
+    async def stream_tip(conversation_id: str, prompt: str):
+        tip = next(next_tip)
+        yield sse({"type": "conversation.response.started", "conversation_id": conversation_id, "created_at": now()})
+        await asyncio.sleep(first_token_ms / 1000)
+        message_id = f"msg_{uuid.uuid4().hex}"
+        tokens = tokenize(tip)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for index in range(0, len(tokens), tokens_per_chunk):
+            # Paced against the start, so slow writes don't lower the rate
+            await asyncio.sleep(max(0.0, start + index / tokens_per_second - loop.time()))
+            yield sse({
+                "type": "message.output.delta",
+                "id": message_id,
+                "content": "".join(tokens[index:index + tokens_per_chunk]),
+                "output_index": 0,
+                "content_index": 0,
+                "role": "assistant",
+                "model": model,
+                "created_at": now(),
+            })
+        prompt_tokens = len(tokenize(prompt))
+        yield sse({
+            "type": "conversation.response.done",
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)},
+            "created_at": now(),
+        })
+
+    @app.post("/v1/agents")
+    async def create_agent(request: Request):
+        body = await request.json()
+        agent = {
+            "id": f"ag_{uuid.uuid4().hex}",
+            "object": "agent",
+            "model": body.get("model", model),
+            "name": body.get("name", ""),
+            "description": body.get("description"),
+            "version": 0,
+            "created_at": now(),
+            "updated_at": now(),
+            "tools": [],
+        }
+        agents[agent["id"]] = agent
+        return agent
+
+    @app.get("/v1/agents/{agent_id}")
+    async def get_agent(agent_id: str):
+        if agent_id not in agents:
+            # Agents persisted by an earlier run of the mock
+            agents[agent_id] = {
+                "id": agent_id, "object": "agent", "model": model, "name": "", "version": 0,
+                "created_at": now(), "updated_at": now(), "tools": [],
+            }
+        return agents[agent_id]
+
+    @app.patch("/v1/agents/{agent_id}")
+    async def update_agent(agent_id: str, request: Request):
+        agent = await get_agent(agent_id)
+        body = await request.json()
+        agent.update({key: value for key, value in body.items() if key in ("tools", "name", "description")})
+        agent.update(version=agent["version"] + 1, updated_at=now())
+        return agent
+
+    def prompt_of(body: Dict) -> str:
+        inputs = body.get("inputs", "")
+        if isinstance(inputs, str):
+            return inputs
+        return "\n".join(str(entry.get("content", "")) for entry in inputs)
+
+    @app.post("/v1/conversations")
+    async def start_conversation(request: Request):
+        body = await request.json()
+        return StreamingResponse(stream_tip(f"conv_{uuid.uuid4().hex}", prompt_of(body)), media_type="text/event-stream")
+
+    @app.post("/v1/conversations/{conversation_id}")
+    async def append_conversation(conversation_id: str, request: Request):
+        body = await request.json()
+        return StreamingResponse(stream_tip(conversation_id, prompt_of(body)), media_type="text/event-stream")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completion(request: Request):
+        body = await request.json()
+        prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+        summary = "The party fought an ogre at the old bridge and made camp in the forest."
+        # Like a non-streamed completion: the whole answer after it was generated
+        await asyncio.sleep((first_token_ms + len(tokenize(summary)) / tokens_per_second * 1000) / 1000)
+        prompt_tokens, completion_tokens = len(tokenize(prompt)), len(tokenize(summary))
+        return JSONResponse({
+            "id": f"cmpl_{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "model": body.get("model", model),
+            "created": int(datetime.now().timestamp()),
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": summary}, "finish_reason": "stop"}],
+        })
+
+    return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8882)
+    parser.add_argument("--tips", default=str(DEFAULT_TIPS), help="YAML file with one canned tip per document")
+    parser.add_argument("--first-token-ms", type=float, default=400, help="Delay before the first token of a tip")
+    parser.add_argument("--tokens-per-second", type=float, default=60)
+    parser.add_argument("--tokens-per-chunk", type=int, default=1, help="Tokens per streamed event")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    app = create_app(load_tips(args.tips), args.first_token_ms, args.tokens_per_second, args.tokens_per_chunk)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -1,32 +1,33 @@
 #!/usr/bin/env python3
 import asyncio
-import os
 import json
-import yaml
+import os
+import sys
 import time
-from fastapi import BackgroundTasks, FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form
+import shutil
+import socket
+import subprocess
+import itertools
+import urllib.request
+from typing import Callable
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from mistralai import Mistral
 from mistralai.extra.run.context import RunContext
 from mistralai.types import BaseModel
 
-from extract_pdf_text import process_pdf_bytes, list_chroma_collections, query_collection
-
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+from extract_pdf_text import list_chroma_collections, query_collection, query_batch, preload_embedding_model, invalidate_collection, cache_stats
+from extract_pdf_text import CHROMA_PATH, CHROMA_SERVER_URL, EmbeddingMismatchError, set_chroma_server, reset_chroma_client
+import ingest_jobs
+from talk_scheduler import TalkScheduler
+from tip_stream import TipStreamParser
+from fanout import ConnectionManager
+from conversation_context import ConversationContext
+from retrieval_prefetch import PREFETCH_COLLECTIONS, PREFETCH_ENABLED, PREFETCH_RESULTS_PER_TERM, RetrievalPrefetcher
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+DEFAULT_SESSION = "default"
 
 manager = ConnectionManager()
 
@@ -38,16 +39,46 @@ api_key = os.environ["MISTRAL_API_KEY"]
 class Talk(BaseModel):
     words_spoken: str
 
-client = Mistral(api_key)
-agent = client.beta.agents.create(
-    model=MODEL,
-    description="Assists the Dungeon Master in a Dungeons and Dragons game",
-    name="Dungeon Master Assistant"
-)
-async def setup_run_ctx():
-    conversation_id = client.beta.conversations.start(
-        agent_id=agent.id,
-        inputs= '''
+class Query(BaseModel):
+    query: str
+    collection_name: str = "dnd-5e-core-rules"
+    n_results: int = 3
+
+class QueryBatch(BaseModel):
+    queries: list[Query]
+
+# Another server speaking the Mistral API, e.g. the mock server of the pipeline benchmark
+client = Mistral(api_key, server_url=os.getenv("MISTRAL_SERVER_URL") or None)
+
+# The agent is created once and its ID reused across restarts
+AGENT_STATE_PATH = os.getenv("AGENT_STATE_PATH", "assistant_agent.json")
+agent_id: str | None = os.getenv("MISTRAL_AGENT_ID") or None
+agent_lock = asyncio.Lock()
+
+async def get_agent_id() -> str:
+    """Return the ID of the agent, creating it only if none was stored for the current model."""
+    global agent_id
+    async with agent_lock:
+        if agent_id is None:
+            try:
+                with open(AGENT_STATE_PATH) as f:
+                    state = json.load(f)
+                if state.get("model") == MODEL:
+                    agent_id = state["agent_id"]
+            except (OSError, ValueError, KeyError):
+                pass
+        if agent_id is None:
+            agent = await client.beta.agents.create_async(
+                model=MODEL,
+                description="Assists the Dungeon Master in a Dungeons and Dragons game",
+                name="Dungeon Master Assistant"
+            )
+            agent_id = agent.id
+            with open(AGENT_STATE_PATH, "w") as f:
+                json.dump({"agent_id": agent_id, "model": MODEL}, f)
+            print(f'created agent {agent_id}')
+    return agent_id
+SYSTEM_PROMPT = '''
         You are an assistant to a Dungeon Master of a Dungeons and Dragons 5E Game.
 
         Your overall job is to respond with tips to the game master that he can
@@ -113,53 +144,150 @@ async def setup_run_ctx():
 
         That's all. Let's start.
         '''
-    ).conversation_id
-    ctx = RunContext(
-        conversation_id=conversation_id,
-        agent_id=agent.id,
-        continue_on_fn_error=True,
-    )
-    return ctx
-
-run_ctx_co = setup_run_ctx()
-run_ctx = None
 
-unprocessed_talk = ''
-is_running = False
-async def process_talk():
-    global is_running
-    global unprocessed_talk
-    global run_ctx
+SUMMARY_PROMPT = '''
+You keep the running summary of a Dungeons and Dragons 5E game for the
+assistant of the Dungeon Master. Update the summary with what the people in
+the room said since. Keep the party, NPCs, locations, quests, open threads and
+ongoing rules situations, drop small talk. Answer with the summary only, in at
+most 300 words.
+'''
+
+async def summarize_talk(summary: str, talk: list[str]) -> str:
+    response = await client.chat.complete_async(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Summary so far:\n{summary or '(none yet)'}\n\nSaid since:\n" + "\n".join(talk)},
+        ],
+    )
+    return response.choices[0].message.content
+
+def new_run_ctx() -> RunContext:
+    # Without a conversation ID the next run starts a new conversation
+    return RunContext(agent_id=agent_id, continue_on_fn_error=True)
+
+contexts: dict[str, ConversationContext] = {}
+context_locks: dict[str, asyncio.Lock] = {}
+async def get_context(session_id: str) -> ConversationContext:
+    # Every session has its own conversation with the agent
+    async with context_locks.setdefault(session_id, asyncio.Lock()):
+        if session_id not in contexts:
+            await get_agent_id()
+            # The conversation starts with the first tip, seeded with the system prompt
+            contexts[session_id] = ConversationContext(None, SYSTEM_PROMPT, new_run_ctx, summarize_talk)
+    return contexts[session_id]
+
+async def prefetch_lookup(terms: list[str]) -> dict[str, list[str]]:
+    """Look up terms in every prefetched collection with one batched retrieval."""
+    def lookup():
+        refresh_collections()
+        existing = [collection.name for collection in list_chroma_collections()]
+        # Configured collections may not have been uploaded yet, skip those instead of creating them
+        collection_names = [name for name in PREFETCH_COLLECTIONS if name in existing] if PREFETCH_COLLECTIONS else existing
+        results = query_batch([
+            {"collection_name": collection_name, "query": term, "n_results": PREFETCH_RESULTS_PER_TERM}
+            for term in terms for collection_name in collection_names
+        ])
+        found: dict[str, list[str]] = {}
+        for result in results:
+            found.setdefault(result["query"], []).extend(result["results"])
+        return found
+    return await asyncio.to_thread(lookup)
+
+prefetcher = RetrievalPrefetcher(prefetch_lookup)
+
+# Streamed tip text is sent at most this many times per second
+TIP_FRAME_RATE = float(os.getenv("TIP_FRAME_RATE", "10"))
+tip_ids = itertools.count(1)
+# Called with the timings of every finished tip, e.g. by the pipeline benchmark
+tip_observers: list[Callable[[dict], None]] = []
+
+async def generate_tip(session_id: str, talk: str):
+    started = time.perf_counter()
+    print(f'next tip for session {session_id}')
+    print(talk)
+    context = await get_context(session_id)
+    # Rulebook passages were looked up while the talk came in
+    passages = await prefetcher.context(session_id) if PREFETCH_ENABLED else ''
+    run_ctx, inputs = context.begin(talk, passages)
+    events = await client.beta.conversations.run_stream_async(
+        run_ctx=run_ctx,
+        inputs=inputs,
+    )
+    # The talk is sent when the stream is first iterated, a cancelled tip must not send it again
+    talk_scheduler.mark_sent(session_id)
+    tip_id = next(tip_ids)
+    parser = TipStreamParser()
+    loop = asyncio.get_running_loop()
+    last_frame = 0.0
+    first_token = None
+    parse_seconds = broadcast_seconds = 0.0
+
+    def send(message: dict):
+        nonlocal broadcast_seconds
+        start = time.perf_counter()
+        manager.broadcast(message, session_id)
+        broadcast_seconds += time.perf_counter() - start
+
+    def send_deltas():
+        deltas = parser.take_deltas()
+        if deltas:
+            send({'type': 'delta', 'tipId': tip_id, 'fields': deltas})
+
+    flush_timer = None
+
+    def flush():
+        nonlocal last_frame, flush_timer
+        flush_timer = None
+        last_frame = loop.time()
+        send_deltas()
 
-    if is_running:
-        return
-    is_running = True
-    while True:
-        if unprocessed_talk == '':
-            await asyncio.sleep(0.1)
-            continue
-        this_talk = unprocessed_talk
-        unprocessed_talk = ''
-        print('next tip')
-        print(this_talk)
-        if run_ctx is None:
-            run_ctx = await run_ctx_co
-        events = await client.beta.conversations.run_stream_async(
-            run_ctx=run_ctx,
-            inputs=this_talk,
-        )
-        buffer = ''
+    try:
         async for chunk in events:
-            try:
-                buffer += chunk.data.content
-                tip = yaml.safe_load(buffer)
-                await manager.broadcast(json.dumps({
-                    'relatedGameRule': tip.get('relatedGameRule') or '',
-                    'readThisTextToYourPlayers': tip.get('readThisTextToYourPlayers') or '',
-                    'whatCouldHappenNext': tip.get('whatCouldHappenNext') or '',
-                }))
-            except (AttributeError, yaml.YAMLError) as err:
-                pass
+            # The last event is the summary of the run, which has no data
+            content = getattr(getattr(chunk, 'data', None), 'content', None)
+            if not isinstance(content, str):
+                continue
+            start = time.perf_counter()
+            first_token = first_token or start
+            parser.feed(content)
+            parse_seconds += time.perf_counter() - start
+            # Coalesce the appended text of all chunks within a frame, and send it
+            # at the end of the frame even if the stream stalls
+            if flush_timer is None:
+                delay = last_frame + 1 / TIP_FRAME_RATE - loop.time()
+                if delay <= 0:
+                    flush()
+                else:
+                    flush_timer = loop.call_later(delay, flush)
+    except asyncio.CancelledError:
+        # The conversation has the talk, so the running summary must have it too
+        context.record(talk, parser.buffer)
+        raise
+    finally:
+        if flush_timer is not None:
+            flush_timer.cancel()
+    send_deltas()
+    start = time.perf_counter()
+    tip = parser.result()
+    parse_seconds += time.perf_counter() - start
+    completed = time.perf_counter()
+    send({'type': 'tip', 'tipId': tip_id, 'complete': True, **tip})
+    context.record(talk, parser.buffer)
+    for observe in tip_observers:
+        observe({
+            'session_id': session_id,
+            'tip_id': tip_id,
+            'talk': talk,
+            'started': started,
+            'first_token': first_token,
+            'completed': completed,
+            'parse_seconds': parse_seconds,
+            'broadcast_seconds': broadcast_seconds,
+        })
+
+talk_scheduler = TalkScheduler(generate_tip)
 
 app = FastAPI(
 	docs_url='/assistant/docs',
@@ -173,66 +301,238 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+startup_tasks: dict[str, asyncio.Future] = {}
+
+@app.on_event("startup")
+async def preload_models():
+    # Nothing blocks startup, the agent and the optional embedding model are resolved in the background
+    startup_tasks["agent"] = asyncio.ensure_future(get_agent_id())
+    if os.getenv("PRELOAD_EMBEDDING_MODEL", "0") == "1":
+        startup_tasks["embedding_model"] = asyncio.get_running_loop().run_in_executor(None, preload_embedding_model)
+
+# Opt-in: the API starts a Chroma server on this port and the ingestion worker
+# writes through it. Without it the worker is the only process writing the
+# embedded store at CHROMA_PATH, and the API only reads it
+CHROMA_SERVER_PORT = os.getenv("CHROMA_SERVER_PORT", "")
+chroma_server_process = None
+
+async def wait_for_chroma_server(url: str, timeout: float = 60.0):
+    """Wait until the started Chroma server answers its heartbeat."""
+    def heartbeat():
+        with urllib.request.urlopen(f"{url}/api/v2/heartbeat", timeout=1) as response:
+            return response.status == 200
+    deadline = time.monotonic() + timeout
+    while True:
+        if chroma_server_process.poll() is not None:
+            raise RuntimeError(f"The Chroma server exited with code {chroma_server_process.returncode}")
+        try:
+            if await asyncio.to_thread(heartbeat):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.2)
+
+async def start_chroma_server(port: int) -> str:
+    """Start `chroma run` on the store at CHROMA_PATH and return its URL once it answers."""
+    global chroma_server_process
+    with socket.socket() as sock:
+        # Otherwise the heartbeat could be answered by the server of another process
+        if sock.connect_ex(("127.0.0.1", port)) == 0:
+            raise RuntimeError(f"CHROMA_SERVER_PORT {port} is already in use")
+    url = f"http://127.0.0.1:{port}"
+    # From now on the store belongs to the server, the API must not open it itself
+    set_chroma_server(url)
+    chroma = os.path.join(os.path.dirname(sys.executable), "chroma")
+    if not os.path.exists(chroma):
+        chroma = shutil.which("chroma") or "chroma"
+    chroma_server_process = subprocess.Popen([chroma, "run", "--path", CHROMA_PATH, "--host", "127.0.0.1", "--port", str(port)])
+    await wait_for_chroma_server(url)
+    return url
+
+ingest_worker_process = None
+
+def start_ingest_worker_process(chroma_server_url: str = ""):
+    global ingest_worker_process
+    worker_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_worker.py")
+    env = {**os.environ, "CHROMA_SERVER_URL": chroma_server_url} if chroma_server_url else None
+    ingest_worker_process = subprocess.Popen([sys.executable, worker_path], env=env)
+
+async def start_chroma_server_and_worker():
+    try:
+        url = await start_chroma_server(int(CHROMA_SERVER_PORT))
+    except Exception as e:
+        print(f'ERROR: The Chroma server on port {CHROMA_SERVER_PORT} did not start, PDFs are not ingested: {e!r}')
+        if chroma_server_process is not None and chroma_server_process.poll() is None:
+            chroma_server_process.terminate()
+        raise
+    if os.getenv("INGEST_WORKER_EMBEDDED", "1") == "1":
+        start_ingest_worker_process(url)
+
+@app.on_event("startup")
+async def start_ingest_worker():
+    ingest_jobs.init_db()
+    if CHROMA_SERVER_PORT and not CHROMA_SERVER_URL:
+        # The worker is only started once the server answers, see /assistant/ready
+        startup_tasks["chroma"] = asyncio.ensure_future(start_chroma_server_and_worker())
+    elif os.getenv("INGEST_WORKER_EMBEDDED", "1") == "1":
+        # PDFs are ingested in a separate process so extraction and embedding don't compete with the event loop
+        start_ingest_worker_process()
+
+@app.on_event("shutdown")
+async def stop_ingest_worker():
+    if ingest_worker_process is not None:
+        ingest_worker_process.terminate()
+        ingest_worker_process.wait()
+
+@app.on_event("shutdown")
+async def stop_chroma_server():
+    if chroma_server_process is not None:
+        chroma_server_process.terminate()
+        chroma_server_process.wait()
+
+collection_versions = {}
+def refresh_collections():
+    """Drop cached handles of collections the ingestion worker changed since the last call."""
+    global collection_versions
+    versions = ingest_jobs.collection_versions()
+    changed = [name for name, version in versions.items() if collection_versions.get(name) != version]
+    if changed:
+        # Without a Chroma server, the API reopens the embedded store to see the worker's writes
+        reset_chroma_client()
+    for collection_name in changed:
+        invalidate_collection(collection_name)
+    collection_versions = versions
+
+@app.on_event("shutdown")
+async def stop_talk_scheduler():
+    await talk_scheduler.close()
+    for context in contexts.values():
+        context.close()
+
+@app.get("/assistant/sessions/{session_id}/context")
+async def get_session_context(session_id: str):
+    """Return the size of the conversation of a session and of its running summary."""
+    if session_id not in contexts:
+        return {"error": "Session not found"}
+    return contexts[session_id].status()
+
 @app.post("/assistant/")
-async def post_talk(talk: Talk, background_tasks: BackgroundTasks):
-    global unprocessed_talk
-    unprocessed_talk += '\n' + talk.words_spoken
-    if not is_running:
-        background_tasks.add_task(process_talk)
+async def post_talk(talk: Talk, session_id: str = DEFAULT_SESSION):
+    if PREFETCH_ENABLED:
+        prefetcher.observe(session_id, talk.words_spoken)
+    talk_scheduler.submit(session_id, talk.words_spoken)
     return {"message": "Notification sent in the background"}
 
 @app.get('/')
 async def health_check():
-    global run_ctx
-    if run_ctx is None:
-        run_ctx = await run_ctx_co
+    """Liveness: the process serves requests."""
     return {"message": "OK"}
 
+@app.get('/assistant/ready')
+async def readiness_check():
+    """Readiness: the agent is resolved, and the embedding model and the Chroma server are up if the API starts them."""
+    status = {}
+    for name, task in startup_tasks.items():
+        if not task.done():
+            status[name] = "loading"
+        elif task.cancelled() or task.exception() is not None:
+            status[name] = "failed"
+        else:
+            status[name] = "ready"
+    # Retry a failed agent lookup, e.g. after the API was unreachable at startup
+    if status.get("agent") == "failed":
+        startup_tasks["agent"] = asyncio.ensure_future(get_agent_id())
+    ready = all(value == "ready" for value in status.values())
+    return JSONResponse({"ready": ready, **status}, status_code=200 if ready else 503)
+
 @app.websocket("/assistant/ws")
-async def new_subscription(websocket: WebSocket):
-    await manager.connect(websocket)
+async def new_subscription(websocket: WebSocket, session_id: str = DEFAULT_SESSION):
+    await manager.connect(websocket, session_id)
     try:
         while True:
             await websocket.receive_json()
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        manager.disconnect(websocket, session_id)
 
 
 @app.post("/assistant/upload-pdf")
 async def upload_pdf(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     collection_name: str = Form(default="dnd-5e-core-rules")
 ):
-    """Upload a PDF file and store its contents in ChromaDB asynchronously."""
+    """Upload a PDF file and queue it for ingestion into ChromaDB. Returns the ingestion job."""
     if not file.filename.lower().endswith('.pdf'):
         return {"error": "File must be a PDF"}
-    content = await file.read()
     pdf_name = os.path.splitext(file.filename)[0]
+    job_id = ingest_jobs.new_job_id()
 
-    # Schedule background task
-    background_tasks.add_task(process_pdf_bytes, content, pdf_name, collection_name)
+    # Copy the upload to the spool directory in chunks instead of reading it into memory
+    def spool():
+        with open(ingest_jobs.spool_path(job_id), "wb") as spooled:
+            shutil.copyfileobj(file.file, spooled, 1024 * 1024)
+    await asyncio.get_running_loop().run_in_executor(None, spool)
+    job = ingest_jobs.create_job(job_id, pdf_name, collection_name)
 
     return {
         "message": "PDF received. Processing in background.",
         "pdf_name": pdf_name,
-        "collection": collection_name
+        "collection": collection_name,
+        "job": job
     }
 
+@app.get("/assistant/ingest-jobs")
+async def list_ingest_jobs(limit: int = 50):
+    """Return the most recent ingestion jobs, newest first."""
+    return {"jobs": ingest_jobs.list_jobs(limit)}
+
+@app.get("/assistant/ingest-jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """Return the status and progress of an ingestion job."""
+    job = ingest_jobs.get_job(job_id)
+    if job is None:
+        return {"error": "Job not found"}
+    return {"job": job}
+
+@app.post("/assistant/ingest-jobs/{job_id}/cancel")
+async def cancel_ingest_job(job_id: str):
+    """Cancel a queued or running ingestion job."""
+    job = ingest_jobs.cancel_job(job_id)
+    if job is None:
+        return {"error": "Job not found"}
+    return {"job": job}
+
+# Retrieval runs the embedding model and Chroma, so these handlers are plain functions that FastAPI runs in its threadpool
 @app.post("/assistant/query-text")
-async def query_text(
+def query_text(
     collection_name: str = Form(default="dnd-5e-core-rules"),
     query: str = Form(...),
     n_results: int = Form(default=3)
 ):
     """Query a collection for relevant documents and return texts."""
     try:
+        refresh_collections()
         docs = query_collection(collection_name, query, int(n_results))
         return {"results": docs, "count": len(docs)}
+    except EmbeddingMismatchError as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.post("/assistant/query-batch")
+def query_text_batch(batch: QueryBatch):
+    """Run several queries, possibly across collections, with one embedding pass. Returns results per query."""
+    try:
+        start = time.perf_counter()
+        refresh_collections()
+        results = query_batch([query.model_dump() for query in batch.queries])
+        return {"results": results, "total_ms": round((time.perf_counter() - start) * 1000, 2)}
+    except EmbeddingMismatchError as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+    except Exception as e:
+        return {"error": str(e)}
+
 @app.get("/assistant/collections")
 async def list_collections():
     """Return a list of all ChromaDB collections."""
@@ -241,3 +541,8 @@ async def list_collections():
         return {"collections": [c.name for c in cols]}
     except Exception as e:
         return {"error": str(e)}
+
+@app.get("/assistant/cache-stats")
+async def get_cache_stats():
+    """Return sizes and hit rates of the query embedding and result caches."""
+    return cache_stats()
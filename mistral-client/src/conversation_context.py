@@ -0,0 +1,127 @@
+import asyncio
+import os
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Estimated tokens a conversation may grow to before it is replaced by a new
+# one, seeded with the system prompt, the running summary and the recent talk
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+# Talk batches that are always kept verbatim
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "4"))
+# Older talk is folded into the summary in the background once it is this large
+CONTEXT_SUMMARIZE_AFTER_TOKENS = int(os.getenv("CONTEXT_SUMMARIZE_AFTER_TOKENS", "1500"))
+
+
+def estimate_tokens(text: str) -> int:
+    # About 4 characters per token for English, good enough for a budget
+    return len(text) // 4 + 1
+
+
+@dataclass
+class Turn:
+    talk: str
+    tokens: int
+
+
+class ConversationContext:
+    """
+    Keeps the conversation of one session within a token budget.
+
+    Talk that left the recent window is folded into a running summary by
+    `summarize(summary, talk)` in the background, off the tip path. When the
+    next talk would take the conversation over budget, `begin` switches to a
+    new conversation whose first input carries the system prompt, the summary
+    and the talk that is not summarized yet, so the prompt, and with it the
+    time to first token, stays flat over a long game. Until the service assigned
+    the conversation an ID, e.g. for the first tip or when that tip was
+    cancelled early, every tip starts a new conversation the same way.
+    """
+
+    def __init__(
+        self,
+        run_ctx: Optional[Any],
+        system_prompt: str,
+        new_run_ctx: Callable[[], Any],
+        summarize: Callable[[str, List[str]], Awaitable[str]],
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        recent_turns: int = CONTEXT_RECENT_TURNS,
+        summarize_after: int = CONTEXT_SUMMARIZE_AFTER_TOKENS,
+    ):
+        self.run_ctx = run_ctx
+        self.system_prompt = system_prompt
+        self.new_run_ctx = new_run_ctx
+        self.summarize = summarize
+        self.budget = budget
+        self.recent_turns = recent_turns
+        self.summarize_after = summarize_after
+        self.summary = ''
+        self.turns: List[Turn] = []  # talk that is not in the summary yet, oldest first
+        self.conversation_tokens = estimate_tokens(system_prompt) if run_ctx is not None else 0
+        self.rollovers = 0
+        self._summarizing: Optional[asyncio.Task] = None
+
+    def begin(self, talk: str, attachment: str = '') -> Tuple[Any, str]:
+        """Return the run context and the inputs for the next tip, with `attachment` after the talk."""
+        tokens = estimate_tokens(talk + attachment)
+        started = getattr(self.run_ctx, 'conversation_id', None) is not None
+        if not started or self.conversation_tokens + tokens > self.budget:
+            if started:
+                self.rollovers += 1
+            inputs = self._seed() + talk + attachment
+            self.run_ctx = self.new_run_ctx()
+            # Replaces the estimate of a conversation that never started
+            self.conversation_tokens = estimate_tokens(inputs)
+            logger.info(f"Started a new conversation seeded with {self.conversation_tokens} tokens")
+        else:
+            inputs = talk + attachment
+            self.conversation_tokens += tokens
+        return self.run_ctx, inputs
+
+    def record(self, talk: str, tip: str):
+        """Account for a finished tip and refresh the summary if enough talk left the recent window."""
+        self.conversation_tokens += estimate_tokens(tip)
+        self.turns.append(Turn(talk, estimate_tokens(talk)))
+        old = self.turns[:-self.recent_turns] if self.recent_turns else self.turns
+        if sum(turn.tokens for turn in old) >= self.summarize_after and not self._summarizing:
+            self._summarizing = asyncio.create_task(self._refresh_summary(old))
+
+    def status(self) -> dict:
+        return {
+            "conversation_tokens": self.conversation_tokens,
+            "summary_tokens": estimate_tokens(self.summary) if self.summary else 0,
+            "unsummarized_turns": len(self.turns),
+            "rollovers": self.rollovers,
+        }
+
+    def _seed(self) -> str:
+        # Keep the seed within half the budget, even if summarizing keeps failing
+        turns, tokens = [], estimate_tokens(self.system_prompt) + estimate_tokens(self.summary)
+        for turn in reversed(self.turns):
+            tokens += turn.tokens
+            if tokens > self.budget // 2 and turns:
+                break
+            turns.insert(0, turn)
+        seed = self.system_prompt + '\n\n'
+        if self.summary:
+            seed += f'Summary of the game so far:\n{self.summary}\n\n'
+        if turns:
+            seed += 'What was said most recently:\n' + '\n'.join(turn.talk for turn in turns) + '\n\n'
+        return seed + 'What was just said:\n'
+
+    async def _refresh_summary(self, old: List[Turn]):
+        try:
+            self.summary = await self.summarize(self.summary, [turn.talk for turn in old])
+            # Turns recorded in the meantime were appended after `old`
+            self.turns = self.turns[len(old):]
+            logger.info(f"Folded {len(old)} turns into the running summary")
+        except Exception as e:
+            logger.exception(f"Refreshing the running summary failed: {e}")
+        finally:
+            self._summarizing = None
+
+    def close(self):
+        if self._summarizing:
+            self._summarizing.cancel()
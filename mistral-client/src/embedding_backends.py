@@ -0,0 +1,83 @@
+import os
+import logging
+from typing import Optional
+
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+logger = logging.getLogger(__name__)
+
+# torch: full precision, torch-int8: dynamically quantized Linear layers,
+# onnx: ONNX Runtime, e.g. with one of the int8 exports of the model
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-ai/nomic-embed-text-v2-moe")
+# File of the ONNX export inside the model repository, empty for the default export
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Inference threads, 0 keeps the runtime's default
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+# Matryoshka truncation of the embeddings, 0 keeps all dimensions
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+
+
+class SentenceTransformerBackend(EmbeddingFunction[Documents]):
+    """Chroma embedding function around a SentenceTransformer running on one of BACKENDS."""
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        backend: str = EMBEDDING_BACKEND,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        threads: int = EMBEDDING_THREADS,
+        dimensions: int = EMBEDDING_DIMENSIONS,
+        onnx_file: Optional[str] = EMBEDDING_ONNX_FILE,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {', '.join(BACKENDS)}")
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        self.backend = backend
+        self.batch_size = batch_size
+        # Recorded on collections, whose vectors are only comparable with the same configuration
+        self.config = {"embedding_model": model_name, "embedding_backend": backend, "embedding_dimensions": dimensions}
+        if threads:
+            torch.set_num_threads(threads)
+
+        model_kwargs = {}
+        if backend == "onnx":
+            try:
+                import onnxruntime
+            except ImportError as e:
+                raise ImportError('The onnx embedding backend needs: pip install "sentence-transformers[onnx]"') from e
+            session_options = onnxruntime.SessionOptions()
+            if threads:
+                session_options.intra_op_num_threads = threads
+            model_kwargs = {"session_options": session_options, "provider": "CPUExecutionProvider"}
+            if onnx_file:
+                model_kwargs["file_name"] = onnx_file
+
+        logger.info(f"Loading embedding model {model_name} on the {backend} backend")
+        self.model = SentenceTransformer(
+            model_name,
+            backend="onnx" if backend == "onnx" else "torch",
+            trust_remote_code=True,
+            truncate_dim=dimensions or None,
+            model_kwargs=model_kwargs or None,
+        )
+        if backend == "torch-int8":
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        # Normalized, so truncated Matryoshka embeddings are still unit vectors
+        embeddings = self.model.encode(
+            list(input), batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True
+        )
+        return [embedding for embedding in embeddings]
+
+
+def create_embedding_function(**overrides) -> SentenceTransformerBackend:
+    """Create the embedding function configured by the EMBEDDING_* variables, with optional overrides."""
+    return SentenceTransformerBackend(**overrides)
+
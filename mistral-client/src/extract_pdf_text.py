@@ -1,53 +1,96 @@
-import pdfplumber
 import sys
 import os
 from datetime import datetime
-import re
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple
+from collections import OrderedDict
 import logging
-import io
+import threading
+import hashlib
+import time
+from urllib.parse import urlparse
+
+import lexical_index
 
 logger = logging.getLogger(__name__)
 
+# pdfplumber, chromadb and the embedding backend are imported where they are
+# first needed, so importing this module (e.g. by the API at boot) stays cheap
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-def process_pdf_bytes(content: bytes, pdf_name: str, collection_name: str):
-    logger.info(f"Starting to process PDF: {pdf_name} for collection: {collection_name}")
-    try:
-        pages = extract_pages_from_pdf(io.BytesIO(content))
-        if not pages:
-            logger.error(f"Failed to extract text from PDF {pdf_name}")
-            return False
-        if store_pages_in_chroma(pages, pdf_name, collection_name):
-            logger.info(f"Successfully processed and stored PDF {pdf_name}")
-            return True
-        else:
-            logger.error(f"Failed to store pages from '{pdf_name}'")
-            return False
-    except Exception as e:
-        logger.exception(f"Error processing PDF {pdf_name}: {e}")
-        return False
+# On-disk location of the Chroma store, so collections survive restarts
+CHROMA_PATH = os.getenv("CHROMA_PATH", "chroma_db")
+# Chroma server owning the store, shared by the API and the ingestion worker.
+# Without one, this process opens the store at CHROMA_PATH itself
+CHROMA_SERVER_URL = os.getenv("CHROMA_SERVER_URL", "")
 
-def clean_text(text: str) -> str:
-    """Clean up extracted text by removing CID codes and normalizing spaces."""
-    logger.debug("Starting text cleaning")
-    # Remove CID codes
-    text = re.sub(r'\(cid:\d+\)', '', text)
-    
-    # Remove multiple spaces and normalize newlines
-    text = ' '.join(text.split())
-    
-    # Remove any remaining control characters
-    text = ''.join(char for char in text if ord(char) >= 32 or char == '\n')
-    
-    logger.debug(f"Text cleaning complete. Final length: {len(text)} characters")
-    return text
+# Process-wide registry: the client and the embedding model are created once,
+# collection handles are kept in an LRU cache keyed by collection name.
+COLLECTION_CACHE_SIZE = int(os.getenv("CHROMA_COLLECTION_CACHE_SIZE", "16"))
+_registry_lock = threading.RLock()
+_chroma_client = None
+_embedding_function = None
+_collections: OrderedDict = OrderedDict()
+
+class LRUCache:
+    """Thread-safe LRU cache that counts hits and misses."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+# Rule lookups repeat a lot during a session: query embeddings are cached by
+# normalized text, results by (collection, version, query, n_results). The
+# version of a collection is bumped whenever it changes, which makes all of its
+# cached results unreachable, including ones a query still in flight against
+# the old contents stores after the change.
+_query_embeddings = LRUCache(int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024")))
+_query_results = LRUCache(int(os.getenv("QUERY_RESULT_CACHE_SIZE", "512")))
+_collection_versions: Dict[str, int] = {}
+
+# Hybrid retrieval: short queries whose exact phrase is found on enough pages
+# are answered from the BM25 index alone, everything else fuses the BM25 and
+# vector rankings with reciprocal rank fusion.
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+LEXICAL_MAX_TERMS = int(os.getenv("LEXICAL_MAX_TERMS", "4"))
+RRF_K = int(os.getenv("RRF_K", "60"))
 
 def extract_pages_from_pdf(pdf_source) -> List[Tuple[int, str]]:
     """
@@ -57,6 +100,9 @@ def extract_pages_from_pdf(pdf_source) -> List[Tuple[int, str]]:
     """
     logger.info("Starting PDF text extraction")
     try:
+        import pdfplumber
+        from pdf_pages import extract_page_text
+
         with pdfplumber.open(pdf_source) as pdf:
             pages = []
             total_pages = len(pdf.pages)
@@ -64,22 +110,9 @@ def extract_pages_from_pdf(pdf_source) -> List[Tuple[int, str]]:
             
             for page_num, page in enumerate(pdf.pages, 1):
                 try:
-                    logger.debug(f"Processing page {page_num}/{total_pages}")
-                    # Try different extraction methods
-                    page_text = page.extract_text()
-                    if not page_text or len(page_text.strip()) < 10:  # If text seems too short
-                        logger.warning(f"Initial text extraction for page {page_num} seems too short, trying alternative method")
-                        # Try alternative extraction
-                        page_text = page.extract_text(x_tolerance=3, y_tolerance=3)
-                    
+                    page_text = extract_page_text(page, page_num)
                     if page_text:
-                        # Clean the page text
-                        cleaned_page_text = clean_text(page_text)
-                        cleaned_page_text += f"\nPage Number: {page_num}"
-                        pages.append((page_num, cleaned_page_text))
-                        logger.debug(f"Successfully extracted text from page {page_num}")
-                    else:
-                        logger.warning(f"No text could be extracted from page {page_num}")
+                        pages.append((page_num, page_text))
                 except Exception as e:
                     logger.error(f"Error extracting text from page {page_num}: {str(e)}")
                     continue
@@ -91,35 +124,118 @@ def extract_pages_from_pdf(pdf_source) -> List[Tuple[int, str]]:
         return []
 
 def get_chroma_client():
-    """Get a ChromaDB client instance."""
-    logger.debug("Initializing ChromaDB client")
-    try:
-        client = chromadb.Client(Settings(
-            persist_directory="chroma_db",
-            anonymized_telemetry=False
-        ))
-        logger.debug("ChromaDB client initialized successfully")
-        return client
-    except Exception as e:
-        logger.error(f"Failed to initialize ChromaDB client: {str(e)}")
-        raise
+    """Get the shared ChromaDB client instance, creating it on first use."""
+    global _chroma_client
+    if _chroma_client is not None:
+        return _chroma_client
+    with _registry_lock:
+        if _chroma_client is not None:
+            return _chroma_client
+        try:
+            import chromadb
+            from chromadb.config import Settings
+
+            if CHROMA_SERVER_URL:
+                logger.debug(f"Connecting to the ChromaDB server at {CHROMA_SERVER_URL}")
+                url = urlparse(CHROMA_SERVER_URL)
+                _chroma_client = chromadb.HttpClient(
+                    host=url.hostname,
+                    port=url.port or (443 if url.scheme == "https" else 80),
+                    ssl=url.scheme == "https",
+                    settings=Settings(anonymized_telemetry=False)
+                )
+            else:
+                logger.debug(f"Initializing persistent ChromaDB client at {CHROMA_PATH}")
+                _chroma_client = chromadb.PersistentClient(
+                    path=CHROMA_PATH,
+                    settings=Settings(anonymized_telemetry=False)
+                )
+            logger.debug("ChromaDB client initialized successfully")
+            return _chroma_client
+        except Exception as e:
+            logger.error(f"Failed to initialize ChromaDB client: {str(e)}")
+            raise
+
+def set_chroma_server(url: str):
+    """Use the Chroma server at `url` from now on, e.g. once the API started it."""
+    global CHROMA_SERVER_URL
+    with _registry_lock:
+        _drop_chroma_client()
+        CHROMA_SERVER_URL = url
+
+def reset_chroma_client():
+    """
+    Reopen the embedded store after another process wrote to it. The embedded
+    client keeps the segments it loaded in memory, so without a Chroma server
+    it would not see pages ingested by the worker.
+    """
+    if CHROMA_SERVER_URL:
+        return
+    with _registry_lock:
+        _drop_chroma_client()
+
+def _drop_chroma_client():
+    global _chroma_client
+    if _chroma_client is not None and not CHROMA_SERVER_URL:
+        # Persistent clients share one system per path, which would be reused otherwise
+        _chroma_client.clear_system_cache()
+    _chroma_client = None
+    _collections.clear()
 
 def get_embedding_function():
-    """Get the Nomic embedding function."""
-    logger.debug("Initializing embedding function")
-    try:
-        embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="nomic-ai/nomic-embed-text-v2-moe",
-            trust_remote_code=True
+    """Get the shared embedding function of the configured backend, loading the model on first use."""
+    global _embedding_function
+    if _embedding_function is not None:
+        return _embedding_function
+    with _registry_lock:
+        if _embedding_function is not None:
+            return _embedding_function
+        logger.info("Loading embedding model")
+        try:
+            from embedding_backends import create_embedding_function
+
+            _embedding_function = create_embedding_function()
+            logger.info("Embedding model loaded successfully")
+            return _embedding_function
+        except Exception as e:
+            logger.error(f"Failed to initialize embedding function: {str(e)}")
+            raise
+
+def preload_embedding_model():
+    """Load the embedding model ahead of the first query."""
+    embedding_function = get_embedding_function()
+    # SentenceTransformer moves weights to the device lazily, a first call finishes the setup
+    embedding_function(["warmup"])
+
+class EmbeddingMismatchError(ValueError):
+    """A collection was embedded with another model, backend or number of dimensions than configured."""
+
+def check_embedding_config(collection, config: Dict):
+    """
+    Make sure the collection's vectors come from the configured embedding
+    function, so queries don't fail on a dimension mismatch or silently compare
+    vectors of different spaces, and uploads don't mix them in one collection.
+    """
+    metadata = collection.metadata or {}
+    stored = {key: metadata[key] for key in config if key in metadata}
+    if not stored:
+        # Created before the configuration was recorded, most likely with another model
+        raise EmbeddingMismatchError(
+            f"Collection '{collection.name}' has no recorded embedding configuration, so it can't be checked "
+            f"against {config}. Delete the collection and upload its PDFs again."
+        )
+    if stored != config:
+        raise EmbeddingMismatchError(
+            f"Collection '{collection.name}' was embedded with {stored}, but the embedding function is configured "
+            f"with {config}. Set EMBEDDING_* back, or delete the collection and upload its PDFs again."
         )
-        logger.debug("Embedding function initialized successfully")
-        return embedding_function
-    except Exception as e:
-        logger.error(f"Failed to initialize embedding function: {str(e)}")
-        raise
 
 def get_or_create_collection(collection_name: str):
-    """Get an existing collection or create a new one."""
+    """Get an existing collection or create a new one. Handles are cached per name."""
+    with _registry_lock:
+        if collection_name in _collections:
+            _collections.move_to_end(collection_name)
+            return _collections[collection_name]
     logger.info(f"Getting or creating collection: {collection_name}")
     try:
         client = get_chroma_client()
@@ -127,15 +243,52 @@ def get_or_create_collection(collection_name: str):
         
         collection = client.get_or_create_collection(
             name=collection_name,
-            metadata={"description": f"Collection for {collection_name}"},
+            metadata={"description": f"Collection for {collection_name}", **embedding_function.config},
             embedding_function=embedding_function
         )
+        check_embedding_config(collection, embedding_function.config)
+        _cache_collection(collection_name, collection)
         logger.info(f"Successfully got/created collection: {collection_name}")
         return collection
     except Exception as e:
         logger.error(f"Failed to get/create collection {collection_name}: {str(e)}")
         raise
 
+def get_collection(collection_name: str):
+    """Get an existing collection, or None if there is none by that name. Unlike get_or_create_collection, never creates one."""
+    with _registry_lock:
+        if collection_name in _collections:
+            _collections.move_to_end(collection_name)
+            return _collections[collection_name]
+    from chromadb.errors import NotFoundError
+
+    try:
+        embedding_function = get_embedding_function()
+        collection = get_chroma_client().get_collection(name=collection_name, embedding_function=embedding_function)
+    except NotFoundError:
+        return None
+    check_embedding_config(collection, embedding_function.config)
+    _cache_collection(collection_name, collection)
+    return collection
+
+def _cache_collection(collection_name: str, collection):
+    with _registry_lock:
+        _collections[collection_name] = collection
+        _collections.move_to_end(collection_name)
+        while len(_collections) > COLLECTION_CACHE_SIZE:
+            _collections.popitem(last=False)
+
+def invalidate_collection(collection_name: str):
+    """Drop the cached handle and query results of a collection, e.g. after it was changed or deleted."""
+    with _registry_lock:
+        _collections.pop(collection_name, None)
+        _collection_versions[collection_name] = _collection_versions.get(collection_name, 0) + 1
+    _query_results.discard_where(lambda key: key[0] == collection_name)
+
+def cache_stats() -> Dict:
+    """Sizes and hit rates of the query caches."""
+    return {"query_embeddings": _query_embeddings.stats(), "query_results": _query_results.stats()}
+
 def list_chroma_collections():
     """List all collections in ChromaDB."""
     logger.info("Listing all ChromaDB collections")
@@ -154,15 +307,34 @@ def delete_collection(collection_name: str) -> bool:
     try:
         client = get_chroma_client()
         client.delete_collection(collection_name)
+        lexical_index.delete_collection(collection_name)
+        invalidate_collection(collection_name)
         logger.info(f"Successfully deleted collection: {collection_name}")
         return True
     except Exception as e:
         logger.error(f"Failed to delete collection {collection_name}: {str(e)}")
         return False
 
+def page_id(pdf_name: str, page_num: int) -> str:
+    return f"{pdf_name}_page_{page_num}"
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def get_stored_hashes(collection, pdf_name: str) -> Dict[str, str]:
+    """Return the content hash of every page of `pdf_name` already in the collection, keyed by ID."""
+    stored = collection.get(where={"pdf_name": pdf_name}, include=["metadatas"])
+    return {
+        doc_id: (metadata or {}).get("content_hash", "")
+        for doc_id, metadata in zip(stored["ids"], stored["metadatas"])
+    }
+
 def store_pages_in_chroma(pages: List[Tuple[int, str]], pdf_name: str, collection_name: str) -> bool:
     """
     Store extracted pages in a specified ChromaDB collection.
+    Pages are compared with what is already stored for `pdf_name` by content
+    hash: unchanged pages are skipped, new or changed pages are upserted (and
+    only those get embedded), pages that no longer exist are deleted.
     Returns True if successful, False otherwise.
     """
     try:
@@ -170,28 +342,39 @@ def store_pages_in_chroma(pages: List[Tuple[int, str]], pdf_name: str, collectio
         
         collection = get_or_create_collection(collection_name)
         logger.info(f"Successfully got/created collection '{collection_name}'")
+        stored_hashes = get_stored_hashes(collection, pdf_name)
         
-        # Prepare data for batch insertion
-        page_nums = [page_num for page_num, _ in pages]
-        texts = [text for _, text in pages]
-        doc_ids = [f"{pdf_name}_page_{page_num}" for page_num in page_nums]
-        
-        metadatas = [{
-            "page_number": page_num,
-            "pdf_name": pdf_name,
-            "timestamp": datetime.now().isoformat()
-        } for page_num in page_nums]
-        
-        logger.info(f"Prepared {len(doc_ids)} documents for insertion")
-        logger.debug(f"First document ID: {doc_ids[0] if doc_ids else 'No documents'}")
-        logger.debug(f"First document length: {len(texts[0]) if texts else 0} characters")
-        
-        collection.add(
-            documents=texts,
-            metadatas=metadatas,
-            ids=doc_ids
+        # Only keep pages whose content differs from the stored version
+        changed = [
+            (page_num, text, content_hash(text)) for page_num, text in pages
+            if stored_hashes.get(page_id(pdf_name, page_num)) != content_hash(text)
+        ]
+        current_ids = {page_id(pdf_name, page_num) for page_num, _ in pages}
+        removed_ids = [doc_id for doc_id in stored_hashes if doc_id not in current_ids]
+        logger.info(
+            f"'{pdf_name}': {len(changed)} new or changed pages, "
+            f"{len(pages) - len(changed)} unchanged, {len(removed_ids)} removed"
         )
-        logger.info(f"Successfully added all documents to collection '{collection_name}'")
+        
+        if changed:
+            collection.upsert(
+                documents=[text for _, text, _ in changed],
+                metadatas=[{
+                    "page_number": page_num,
+                    "pdf_name": pdf_name,
+                    "content_hash": text_hash,
+                    "timestamp": datetime.now().isoformat()
+                } for page_num, _, text_hash in changed],
+                ids=[page_id(pdf_name, page_num) for page_num, _, _ in changed]
+            )
+        if removed_ids:
+            collection.delete(ids=removed_ids)
+            lexical_index.delete_pages(collection_name, removed_ids)
+        # Indexing text is cheap, so every page is (re)indexed, including ones stored before the index existed
+        lexical_index.upsert_pages(collection_name, [(page_id(pdf_name, page_num), pdf_name, text) for page_num, text in pages])
+        if changed or removed_ids:
+            invalidate_collection(collection_name)
+        logger.info(f"Successfully synced all documents to collection '{collection_name}'")
         return True
     except Exception as e:
         logger.error(f"Error storing pages in ChromaDB collection {collection_name}: {str(e)}")
@@ -222,16 +405,125 @@ def save_text_to_file(text: str, original_filename: str) -> str:
         logger.error(f"Failed to save text to file: {str(e)}")
         raise
 
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def embed_queries(queries: List[str]) -> List[List[float]]:
+    """Embed normalized queries in one forward pass, reusing the embeddings of earlier identical queries."""
+    embeddings = {query: _query_embeddings.get(query) for query in dict.fromkeys(queries)}
+    missing = [query for query, embedding in embeddings.items() if embedding is None]
+    if missing:
+        for query, embedding in zip(missing, get_embedding_function()(missing)):
+            # Plain floats: Chroma rejects lists of numpy scalars
+            embeddings[query] = [float(value) for value in embedding]
+            _query_embeddings.put(query, embeddings[query])
+    return [embeddings[query] for query in queries]
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[str, str]]], n_results: int) -> List[Tuple[str, str]]:
+    """Merge rankings of (doc_id, text) pages by the sum of 1 / (RRF_K + rank) over the rankings."""
+    scores: Dict[str, float] = {}
+    texts: Dict[str, str] = {}
+    for ranking in rankings:
+        for rank, (doc_id, text) in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank)
+            texts[doc_id] = text
+    best = sorted(scores, key=scores.get, reverse=True)[:n_results]
+    return [(doc_id, texts[doc_id]) for doc_id in best]
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+def query_batch(queries: List[Dict]) -> List[Dict]:
+    """
+    Run several lookups, possibly across collections, at the cost of about one
+    model call. Each query is a dict with `collection_name`, `query` and
+    optionally `n_results` (default 5).
+
+    Queries are answered from the result cache or, if their exact phrase is
+    found on enough pages, from the lexical index. All other queries are
+    embedded together in one forward pass and searched with one Chroma query
+    per collection, then fused with their lexical rankings.
+
+    Returns one dict per query, in order, with `results`, `source` (cache,
+    lexical, hybrid or dense) and `timing` in milliseconds, where the embedding
+    time is that of the shared forward pass.
+    """
+    items = []
+    for spec in queries:
+        collection_name, n_results = spec["collection_name"], int(spec.get("n_results", 5))
+        query = normalize_query(spec["query"])
+        with _registry_lock:
+            key = (collection_name, _collection_versions.get(collection_name, 0), query, n_results)
+        items.append({
+            "collection_name": collection_name, "query": query, "n_results": n_results, "key": key,
+            "hits": None, "rankings": [], "source": None, "timing": {}
+        })
+
+    for item in items:
+        start = time.perf_counter()
+        documents = _query_results.get(item["key"])
+        if documents is not None:
+            item.update(results=list(documents), source="cache")
+        elif HYBRID_RETRIEVAL:
+            if len(lexical_index.terms(item["query"])) <= LEXICAL_MAX_TERMS:
+                exact = lexical_index.search(item["collection_name"], item["query"], item["n_results"], phrase=True)
+                if len(exact) >= item["n_results"]:
+                    # A named rule or spell: no need to run the embedding model
+                    item.update(hits=exact, source="lexical")
+                item["rankings"].append(exact)
+            if item["source"] is None:
+                item["rankings"].append(lexical_index.search(item["collection_name"], item["query"], item["n_results"]))
+        item["timing"]["lexical_ms"] = _elapsed_ms(start)
+
+    pending = [item for item in items if item["source"] is None]
+    if pending:
+        start = time.perf_counter()
+        embeddings = embed_queries([item["query"] for item in pending])
+        embed_ms = _elapsed_ms(start)
+        for collection_name in dict.fromkeys(item["collection_name"] for item in pending):
+            group = [(item, embedding) for item, embedding in zip(pending, embeddings) if item["collection_name"] == collection_name]
+            start = time.perf_counter()
+            collection = get_collection(collection_name)
+            if collection is None:
+                # Nothing was uploaded into it yet
+                result = {"ids": [[] for _ in group], "documents": [[] for _ in group]}
+            else:
+                result = collection.query(
+                    query_embeddings=[embedding for _, embedding in group],
+                    n_results=max(item["n_results"] for item, _ in group)
+                )
+            search_ms = _elapsed_ms(start)
+            for (item, _), ids, documents in zip(group, result["ids"], result["documents"]):
+                dense = list(zip(ids, documents))[:item["n_results"]]
+                if HYBRID_RETRIEVAL:
+                    item.update(hits=reciprocal_rank_fusion(item["rankings"] + [dense], item["n_results"]), source="hybrid")
+                else:
+                    item.update(hits=dense, source="dense")
+                item["timing"].update(embed_ms=embed_ms, search_ms=search_ms)
+
+    for item in items:
+        if item["source"] != "cache":
+            item["results"] = [text for _, text in item["hits"]]
+            _query_results.put(item["key"], tuple(item["results"]))
+    return [{
+        "collection_name": item["collection_name"],
+        "query": item["query"],
+        "results": item["results"],
+        "count": len(item["results"]),
+        "source": item["source"],
+        "timing": item["timing"]
+    } for item in items]
+
 def query_collection(collection_name: str, query: str, n_results: int = 5) -> List[str]:
     """Query a ChromaDB collection and return the top N matching documents' texts."""
     logger.info(f"Querying collection '{collection_name}' with query: {query}")
     try:
-        collection = get_or_create_collection(collection_name)
-        result = collection.query(query_texts=[query], n_results=n_results)
-        # result['documents'] is a list of lists: [[doc1, doc2, ...]]
-        documents = result.get('documents', [[]])[0]
-        logger.info(f"Query successful. Found {len(documents)} results")
-        return documents
+        result = query_batch([{"collection_name": collection_name, "query": query, "n_results": n_results}])[0]
+        logger.info(f"Query successful ({result['source']}). Found {result['count']} results")
+        return result["results"]
+    except EmbeddingMismatchError:
+        # Not the same as finding nothing: the collection must be rebuilt
+        raise
     except Exception as e:
         logger.exception(f"Error querying collection {collection_name}: {e}")
         return []
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import os
+import logging
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# Messages a subscriber can fall behind by before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SUBSCRIBER_QUEUE_SIZE", "8"))
+# A subscriber that takes longer than this to accept a message is disconnected
+SUBSCRIBER_SEND_TIMEOUT = float(os.getenv("SUBSCRIBER_SEND_TIMEOUT", "5"))
+
+
+class Subscriber:
+    """
+    A websocket with its own writer task and a small queue of pending messages.
+
+    The queue only keeps the latest tip state: a message of a newer tip drops
+    everything queued for older ones, deltas of the same tip are merged, and a
+    complete tip replaces its own deltas. A slow subscriber therefore skips
+    ahead to the current tip instead of replaying every frame.
+    """
+
+    def __init__(self, websocket: WebSocket, on_dead):
+        self.websocket = websocket
+        self.pending: List[Dict] = []
+        self._ready = asyncio.Event()
+        self._on_dead = on_dead
+        self._writer = asyncio.create_task(self._write())
+
+    def offer(self, message: Dict):
+        tip_id = message.get('tipId')
+        if tip_id is not None:
+            self.pending = [queued for queued in self.pending if queued.get('tipId') == tip_id]
+            last = self.pending[-1] if self.pending else None
+            if message.get('type') == 'tip':
+                self.pending = []
+            elif last is not None and last.get('type') == 'delta':
+                fields = dict(last['fields'])
+                for field, text in message['fields'].items():
+                    fields[field] = fields.get(field, '') + text
+                self.pending[-1] = {**last, 'fields': fields}
+                self._ready.set()
+                return
+        self.pending.append(message)
+        del self.pending[:-SUBSCRIBER_QUEUE_SIZE]
+        self._ready.set()
+
+    async def _write(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                messages, self.pending = self.pending, []
+                for message in messages:
+                    await asyncio.wait_for(self.websocket.send_text(json.dumps(message)), SUBSCRIBER_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Dropping subscriber after a failed send: {e!r}")
+            self._on_dead(self)
+
+    def close(self):
+        self._writer.cancel()
+
+
+class ConnectionManager:
+    """Fans messages out to the subscribers of a session without waiting for any of them."""
+
+    def __init__(self):
+        # Subscribers per session, every game table only gets its own tips
+        self.active_connections: Dict[str, List[Subscriber]] = {}
+
+    async def connect(self, websocket: WebSocket, session_id: str):
+        await websocket.accept()
+        subscriber = Subscriber(websocket, lambda dead: self._drop(dead, session_id))
+        self.active_connections.setdefault(session_id, []).append(subscriber)
+
+    def disconnect(self, websocket: WebSocket, session_id: str):
+        subscriber = self._find(websocket, session_id)
+        if subscriber is not None:
+            self._drop(subscriber, session_id)
+
+    def broadcast(self, message: Dict, session_id: str):
+        for subscriber in self.active_connections.get(session_id, []):
+            subscriber.offer(message)
+
+    def _find(self, websocket: WebSocket, session_id: str) -> Optional[Subscriber]:
+        for subscriber in self.active_connections.get(session_id, []):
+            if subscriber.websocket is websocket:
+                return subscriber
+        return None
+
+    def _drop(self, subscriber: Subscriber, session_id: str):
+        subscribers = self.active_connections.get(session_id, [])
+        if subscriber in subscribers:
+            subscribers.remove(subscriber)
+            subscriber.close()
+            if not subscribers:
+                del self.active_connections[session_id]
+            # Unblocks the receive loop of a half-dead connection
+            asyncio.create_task(self._close_quietly(subscriber.websocket))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
@@ -0,0 +1,188 @@
+import os
+import sqlite3
+import time
+import uuid
+import logging
+from contextlib import closing
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Job queue shared by the API process and the ingestion worker process
+INGEST_DB_PATH = os.getenv("INGEST_DB_PATH", "ingest_jobs.db")
+# Uploaded PDFs wait here until the worker has ingested them
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "ingest_spool")
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    pdf_name TEXT NOT NULL,
+    collection_name TEXT NOT NULL,
+    spool_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    pages_total INTEGER NOT NULL DEFAULT 0,
+    pages_extracted INTEGER NOT NULL DEFAULT 0,
+    pages_embedded INTEGER NOT NULL DEFAULT 0,
+    pages_unchanged INTEGER NOT NULL DEFAULT 0,
+    pages_removed INTEGER NOT NULL DEFAULT 0,
+    pages_per_second REAL NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS collection_versions (
+    collection_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+PROGRESS_FIELDS = ("pages_total", "pages_extracted", "pages_embedded", "pages_unchanged", "pages_removed", "pages_per_second")
+
+
+def _connect() -> sqlite3.Connection:
+    connection = sqlite3.connect(INGEST_DB_PATH, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def init_db():
+    """Create the tables and the spool directory. Safe to call from every process."""
+    os.makedirs(INGEST_SPOOL_DIR, exist_ok=True)
+    with closing(_connect()) as db:
+        # WAL lets the API read job progress while the worker writes it
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(_SCHEMA)
+
+
+def spool_path(job_id: str) -> str:
+    return os.path.join(INGEST_SPOOL_DIR, f"{job_id}.pdf")
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def create_job(job_id: str, pdf_name: str, collection_name: str) -> Dict:
+    """Queue a job for a PDF that was already spooled to `spool_path(job_id)`."""
+    with closing(_connect()) as db:
+        db.execute(
+            "INSERT INTO jobs (id, pdf_name, collection_name, spool_path, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, pdf_name, collection_name, spool_path(job_id), QUEUED, time.time())
+        )
+    logger.info(f"Queued ingestion job {job_id} for '{pdf_name}' into '{collection_name}'")
+    return get_job(job_id)
+
+
+def _to_dict(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    job.pop("spool_path")
+    return job
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    with closing(_connect()) as db:
+        row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _to_dict(row) if row else None
+
+
+def list_jobs(limit: int = 50) -> List[Dict]:
+    with closing(_connect()) as db:
+        rows = db.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+    return [_to_dict(row) for row in rows]
+
+
+def cancel_job(job_id: str) -> Optional[Dict]:
+    """
+    Cancel a job. Queued jobs are cancelled right away, running jobs are flagged
+    and stopped by the worker at its next progress update.
+    """
+    with closing(_connect()) as db:
+        db.execute("BEGIN IMMEDIATE")
+        row = db.execute("SELECT status, spool_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            db.execute("ROLLBACK")
+            return None
+        if row["status"] == QUEUED:
+            db.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?", (CANCELLED, time.time(), job_id))
+        elif row["status"] == RUNNING:
+            db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+        db.execute("COMMIT")
+    if row["status"] == QUEUED:
+        remove_spooled(row["spool_path"])
+    logger.info(f"Cancellation requested for ingestion job {job_id}")
+    return get_job(job_id)
+
+
+def claim_next_job() -> Optional[sqlite3.Row]:
+    """Mark the oldest queued job as running and return it, or None if the queue is empty."""
+    with closing(_connect()) as db:
+        db.execute("BEGIN IMMEDIATE")
+        row = db.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)).fetchone()
+        if row is not None:
+            db.execute("UPDATE jobs SET status = ?, started_at = ? WHERE id = ?", (RUNNING, time.time(), row["id"]))
+        db.execute("COMMIT")
+    return row
+
+
+def requeue_interrupted_jobs() -> int:
+    """Put jobs that were running when the worker died back in the queue."""
+    with closing(_connect()) as db:
+        count = db.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ? AND cancel_requested = 0", (QUEUED, RUNNING)
+        ).rowcount
+        db.execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE status = ? AND cancel_requested = 1",
+            (CANCELLED, time.time(), RUNNING)
+        )
+    return count
+
+
+def update_progress(job_id: str, progress: Dict) -> bool:
+    """Store the progress of a running job. Returns True if cancellation was requested."""
+    with closing(_connect()) as db:
+        db.execute(
+            f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in PROGRESS_FIELDS)} WHERE id = ?",
+            [progress[name] for name in PROGRESS_FIELDS] + [job_id]
+        )
+        row = db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return bool(row and row["cancel_requested"])
+
+
+def finish_job(job_id: str, status: str, progress: Optional[Dict] = None, error: Optional[str] = None):
+    progress = progress or {}
+    fields = [name for name in PROGRESS_FIELDS if name in progress]
+    with closing(_connect()) as db:
+        db.execute(
+            f"UPDATE jobs SET {''.join(f'{name} = ?, ' for name in fields)}status = ?, error = ?, finished_at = ? WHERE id = ?",
+            [progress[name] for name in fields] + [status, error, time.time(), job_id]
+        )
+
+
+def remove_spooled(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def bump_collection_version(collection_name: str):
+    """Record that a collection changed, so other processes drop what they cached about it."""
+    with closing(_connect()) as db:
+        db.execute(
+            "INSERT INTO collection_versions (collection_name, version) VALUES (?, 1) "
+            "ON CONFLICT (collection_name) DO UPDATE SET version = version + 1",
+            (collection_name,)
+        )
+
+
+def collection_versions() -> Dict[str, int]:
+    with closing(_connect()) as db:
+        rows = db.execute("SELECT collection_name, version FROM collection_versions").fetchall()
+    return {row["collection_name"]: row["version"] for row in rows}
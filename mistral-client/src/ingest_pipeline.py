@@ -0,0 +1,174 @@
+import os
+import queue
+import tempfile
+import threading
+import time
+import logging
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from extract_pdf_text import content_hash, get_or_create_collection, get_stored_hashes, invalidate_collection, page_id
+from pdf_pages import count_pages, extract_page_range
+import lexical_index
+
+logger = logging.getLogger(__name__)
+
+# Extraction fan-out: worker processes and pages per task
+EXTRACT_WORKERS = int(os.getenv("INGEST_EXTRACT_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "8"))
+# Pages embedded and written to Chroma per upsert
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "32"))
+# Embedding batches allowed to wait for the writer before extraction pauses
+MAX_PENDING_BATCHES = int(os.getenv("INGEST_MAX_PENDING_BATCHES", "4"))
+
+
+@dataclass
+class IngestStats:
+    pages_total: int = 0
+    pages_extracted: int = 0
+    pages_embedded: int = 0
+    pages_unchanged: int = 0
+    pages_removed: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def to_dict(self) -> dict:
+        stats = asdict(self)
+        stats.pop("started_at")
+        stats["elapsed_seconds"] = round(self.elapsed, 2)
+        stats["pages_per_second"] = round(self.pages_extracted / self.elapsed, 2) if self.elapsed else 0.0
+        return stats
+
+
+def _write_batches(collection, collection_name: str, pdf_name: str, batches: queue.Queue, stats: IngestStats, on_progress, errors: list):
+    """Embedding stage: upsert every batch as it arrives. Chroma embeds the documents inside upsert."""
+    try:
+        while (batch := batches.get()) is not None:
+            collection.upsert(
+                documents=[text for _, text, _ in batch],
+                metadatas=[{
+                    "page_number": page_num,
+                    "pdf_name": pdf_name,
+                    "content_hash": text_hash,
+                    "timestamp": datetime.now().isoformat()
+                } for page_num, _, text_hash in batch],
+                ids=[page_id(pdf_name, page_num) for page_num, _, _ in batch]
+            )
+            lexical_index.upsert_pages(collection_name, [(page_id(pdf_name, page_num), pdf_name, text) for page_num, text, _ in batch])
+            stats.pages_embedded += len(batch)
+            on_progress(stats)
+    except Exception as e:
+        errors.append(e)
+        # Keep draining so the producer never blocks on a dead writer
+        while batches.get() is not None:
+            pass
+
+
+def ingest_pdf(
+    pdf_path: str,
+    pdf_name: str,
+    collection_name: str,
+    on_progress: Optional[Callable[[IngestStats], None]] = None,
+) -> IngestStats:
+    """
+    Ingest a PDF on disk into a Chroma collection as a three stage pipeline:
+
+    1. page ranges are extracted and cleaned in parallel by a process pool,
+    2. pages are compared with the stored content hashes as results come in,
+    3. new or changed pages are embedded and upserted in fixed-size batches by
+       a writer thread while extraction continues.
+
+    At most 2 ranges per worker and MAX_PENDING_BATCHES batches are in flight,
+    so memory stays bounded regardless of the size of the book, and the total
+    time approaches that of the slowest stage.
+    """
+    on_progress = on_progress or (lambda stats: None)
+    stats = IngestStats(pages_total=count_pages(pdf_path))
+    collection = get_or_create_collection(collection_name)
+    stored_hashes = get_stored_hashes(collection, pdf_name)
+    indexed_ids = lexical_index.indexed_ids(collection_name, pdf_name)
+    logger.info(f"Ingesting {stats.pages_total} pages of '{pdf_name}' into '{collection_name}' with {EXTRACT_WORKERS} workers")
+
+    batches: queue.Queue = queue.Queue(maxsize=MAX_PENDING_BATCHES)
+    errors: List[Exception] = []
+    writer = threading.Thread(target=_write_batches, args=(collection, collection_name, pdf_name, batches, stats, on_progress, errors))
+    writer.start()
+
+    seen_ids = set()
+    unindexed: List[Tuple[str, str, str]] = []
+    batch: List[Tuple[int, str, str]] = []
+    ranges = iter([(start, min(start + PAGES_PER_TASK, stats.pages_total)) for start in range(0, stats.pages_total, PAGES_PER_TASK)])
+    try:
+        # Spawn rather than fork: the worker process runs the writer thread and holds the embedding model
+        with ProcessPoolExecutor(EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn")) as executor:
+            in_flight = set()
+            while True:
+                while len(in_flight) < 2 * EXTRACT_WORKERS and (page_range := next(ranges, None)):
+                    in_flight.add(executor.submit(extract_page_range, pdf_path, *page_range))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for page_num, text in future.result():
+                        stats.pages_extracted += 1
+                        doc_id = page_id(pdf_name, page_num)
+                        seen_ids.add(doc_id)
+                        text_hash = content_hash(text)
+                        if stored_hashes.get(doc_id) == text_hash:
+                            stats.pages_unchanged += 1
+                            if doc_id not in indexed_ids:
+                                # Embedded before the lexical index existed
+                                unindexed.append((doc_id, pdf_name, text))
+                            continue
+                        batch.append((page_num, text, text_hash))
+                        if len(batch) >= EMBED_BATCH_SIZE:
+                            # Blocks while the writer is MAX_PENDING_BATCHES behind
+                            batches.put(batch)
+                            batch = []
+                on_progress(stats)
+                if errors:
+                    raise errors[0]
+        if batch:
+            batches.put(batch)
+    finally:
+        batches.put(None)
+        writer.join()
+    if errors:
+        raise errors[0]
+
+    if unindexed:
+        lexical_index.upsert_pages(collection_name, unindexed)
+    removed_ids = [doc_id for doc_id in stored_hashes if doc_id not in seen_ids]
+    if removed_ids:
+        collection.delete(ids=removed_ids)
+        lexical_index.delete_pages(collection_name, removed_ids)
+    stats.pages_removed = len(removed_ids)
+    if stats.pages_embedded or removed_ids or unindexed:
+        invalidate_collection(collection_name)
+    on_progress(stats)
+    logger.info(f"Ingested '{pdf_name}': {stats.to_dict()}")
+    return stats
+
+
+def process_pdf_bytes(content: bytes, pdf_name: str, collection_name: str):
+    logger.info(f"Starting to process PDF: {pdf_name} for collection: {collection_name}")
+    try:
+        # Extraction workers open the PDF themselves, so hand them a file instead of the bytes
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+            pdf_file.write(content)
+            pdf_file.flush()
+            stats = ingest_pdf(pdf_file.name, pdf_name, collection_name)
+        if not stats.pages_extracted:
+            logger.error(f"Failed to extract text from PDF {pdf_name}")
+            return False
+        logger.info(f"Successfully processed and stored PDF {pdf_name}")
+        return True
+    except Exception as e:
+        logger.exception(f"Error processing PDF {pdf_name}: {e}")
+        return False
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Ingestion worker: takes PDF jobs from the queue in ingest_jobs and runs them
+through the ingestion pipeline, outside of the API process.
+
+The API starts it as a subprocess unless INGEST_WORKER_EMBEDDED=0, in which
+case run it separately with `python ingest_worker.py`.
+"""
+import os
+import threading
+import time
+import logging
+
+import ingest_jobs
+from ingest_pipeline import IngestStats, ingest_pdf
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", "0.5"))
+PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", "0.5"))
+# Run below the API's priority so ingestion never slows down live tips
+WORKER_NICE = int(os.getenv("INGEST_WORKER_NICE", "10"))
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+class ProgressReporter:
+    """Writes pipeline progress to the job at most every PROGRESS_INTERVAL and raises once the job is cancelled."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._lock = threading.Lock()
+        self._last_update = 0.0
+
+    def __call__(self, stats: IngestStats):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_update < PROGRESS_INTERVAL:
+                return
+            self._last_update = now
+            cancel_requested = ingest_jobs.update_progress(self.job_id, stats.to_dict())
+        if cancel_requested:
+            raise IngestCancelled()
+
+
+def run_job(job):
+    logger.info(f"Starting ingestion job {job['id']} for '{job['pdf_name']}'")
+    try:
+        stats = ingest_pdf(job["spool_path"], job["pdf_name"], job["collection_name"], ProgressReporter(job["id"]))
+        ingest_jobs.finish_job(job["id"], ingest_jobs.DONE, stats.to_dict())
+        logger.info(f"Finished ingestion job {job['id']}")
+    except IngestCancelled:
+        ingest_jobs.finish_job(job["id"], ingest_jobs.CANCELLED)
+        logger.info(f"Cancelled ingestion job {job['id']}")
+    except Exception as e:
+        logger.exception(f"Ingestion job {job['id']} failed: {e}")
+        ingest_jobs.finish_job(job["id"], ingest_jobs.FAILED, error=str(e))
+    finally:
+        # Also after a cancellation or failure: some batches may already be written
+        ingest_jobs.bump_collection_version(job["collection_name"])
+        ingest_jobs.remove_spooled(job["spool_path"])
+
+
+def run():
+    if WORKER_NICE:
+        os.nice(WORKER_NICE)
+    ingest_jobs.init_db()
+    requeued = ingest_jobs.requeue_interrupted_jobs()
+    if requeued:
+        logger.info(f"Re-queued {requeued} interrupted ingestion jobs")
+    logger.info("Ingestion worker waiting for jobs")
+    while True:
+        job = ingest_jobs.claim_next_job()
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        run_job(job)
+
+
+if __name__ == "__main__":
+    try:
+        run()
+    except KeyboardInterrupt:
+        pass
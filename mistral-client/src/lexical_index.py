@@ -0,0 +1,104 @@
+import os
+import re
+import sqlite3
+import logging
+from contextlib import closing
+from typing import Iterable, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# BM25 index over the same pages as the Chroma collections, for exact rule and spell names
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "lexical_index.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    rowid INTEGER PRIMARY KEY,
+    collection_name TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    pdf_name TEXT NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (collection_name, doc_id)
+);
+CREATE INDEX IF NOT EXISTS pages_pdf ON pages (collection_name, pdf_name);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+    text, content='pages', content_rowid='rowid', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS pages_insert AFTER INSERT ON pages BEGIN
+    INSERT INTO pages_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS pages_delete AFTER DELETE ON pages BEGIN
+    INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS pages_update AFTER UPDATE ON pages BEGIN
+    INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+    INSERT INTO pages_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+"""
+
+_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    connection = sqlite3.connect(LEXICAL_INDEX_PATH, timeout=30)
+    if not _initialized:
+        # WAL lets queries read while the ingestion worker writes
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        _initialized = True
+    return connection
+
+
+def terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def upsert_pages(collection_name: str, pages: Iterable[Tuple[str, str, str]]):
+    """Index (doc_id, pdf_name, text) pages, replacing earlier versions with the same ID."""
+    with closing(_connect()) as db, db:
+        db.executemany(
+            "INSERT INTO pages (collection_name, doc_id, pdf_name, text) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (collection_name, doc_id) DO UPDATE SET pdf_name = excluded.pdf_name, text = excluded.text",
+            [(collection_name, doc_id, pdf_name, text) for doc_id, pdf_name, text in pages]
+        )
+
+
+def delete_pages(collection_name: str, doc_ids: List[str]):
+    with closing(_connect()) as db, db:
+        db.executemany(
+            "DELETE FROM pages WHERE collection_name = ? AND doc_id = ?",
+            [(collection_name, doc_id) for doc_id in doc_ids]
+        )
+
+
+def delete_collection(collection_name: str):
+    with closing(_connect()) as db, db:
+        db.execute("DELETE FROM pages WHERE collection_name = ?", (collection_name,))
+
+
+def indexed_ids(collection_name: str, pdf_name: str) -> Set[str]:
+    with closing(_connect()) as db:
+        rows = db.execute(
+            "SELECT doc_id FROM pages WHERE collection_name = ? AND pdf_name = ?", (collection_name, pdf_name)
+        ).fetchall()
+    return {doc_id for doc_id, in rows}
+
+
+def search(collection_name: str, query: str, n_results: int, phrase: bool = False) -> List[Tuple[str, str]]:
+    """
+    Return up to `n_results` (doc_id, text) pages of a collection ranked by BM25.
+    With `phrase`, pages must contain the query terms next to each other,
+    otherwise any of the terms matches.
+    """
+    query_terms = terms(query)
+    if not query_terms:
+        return []
+    quoted = [f'"{term}"' for term in query_terms]
+    match = f'"{" ".join(query_terms)}"' if phrase else " OR ".join(quoted)
+    with closing(_connect()) as db:
+        rows = db.execute(
+            "SELECT pages.doc_id, pages.text FROM pages_fts JOIN pages ON pages.rowid = pages_fts.rowid "
+            "WHERE pages_fts MATCH ? AND pages.collection_name = ? ORDER BY bm25(pages_fts) LIMIT ?",
+            (match, collection_name, n_results)
+        ).fetchall()
+    return [(doc_id, text) for doc_id, text in rows]
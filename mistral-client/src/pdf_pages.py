@@ -0,0 +1,66 @@
+import pdfplumber
+import re
+from typing import List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Only depends on pdfplumber, so ingestion worker processes can import it
+# without pulling in chromadb or the embedding model.
+
+def clean_text(text: str) -> str:
+    """Clean up extracted text by removing CID codes and normalizing spaces."""
+    logger.debug("Starting text cleaning")
+    # Remove CID codes
+    text = re.sub(r'\(cid:\d+\)', '', text)
+
+    # Remove multiple spaces and normalize newlines
+    text = ' '.join(text.split())
+
+    # Remove any remaining control characters
+    text = ''.join(char for char in text if ord(char) >= 32 or char == '\n')
+
+    logger.debug(f"Text cleaning complete. Final length: {len(text)} characters")
+    return text
+
+def extract_page_text(page, page_num: int) -> Optional[str]:
+    """Extract and clean the text of one pdfplumber page. Returns None if the page has no text."""
+    logger.debug(f"Processing page {page_num}")
+    # Try different extraction methods
+    page_text = page.extract_text()
+    if not page_text or len(page_text.strip()) < 10:  # If text seems too short
+        logger.warning(f"Initial text extraction for page {page_num} seems too short, trying alternative method")
+        # Try alternative extraction
+        page_text = page.extract_text(x_tolerance=3, y_tolerance=3)
+
+    if not page_text:
+        logger.warning(f"No text could be extracted from page {page_num}")
+        return None
+    # Clean the page text
+    cleaned_page_text = clean_text(page_text)
+    cleaned_page_text += f"\nPage Number: {page_num}"
+    logger.debug(f"Successfully extracted text from page {page_num}")
+    return cleaned_page_text
+
+def count_pages(pdf_path: str) -> int:
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Extract the cleaned text of pages [start, end) (0-based indices) of a PDF on disk.
+    Returns (page_number, cleaned_text) tuples with 1-based page numbers.
+    """
+    pages = []
+    with pdfplumber.open(pdf_path, pages=list(range(start + 1, end + 1))) as pdf:
+        for page in pdf.pages:
+            try:
+                page_text = extract_page_text(page, page.page_number)
+                if page_text:
+                    pages.append((page.page_number, page_text))
+            except Exception as e:
+                logger.error(f"Error extracting text from page {page.page_number}: {str(e)}")
+            finally:
+                # Drop the page's parsed layout, it is not needed anymore
+                page.close()
+    return pages
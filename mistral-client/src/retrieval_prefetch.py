@@ -0,0 +1,130 @@
+import asyncio
+import math
+import os
+import re
+import time
+import logging
+from typing import Awaitable, Callable, Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+# How long a tip may wait for lookups that are still running
+PREFETCH_BUDGET_MS = int(os.getenv("PREFETCH_BUDGET_MS", "150"))
+# Passages attached to a tip, and their maximum length
+PREFETCH_PASSAGES = int(os.getenv("PREFETCH_PASSAGES", "3"))
+PREFETCH_MAX_CHARS = int(os.getenv("PREFETCH_MAX_CHARS", "1200"))
+# Terms kept per session, and how fast mentions of a term lose weight
+PREFETCH_CACHE_SIZE = int(os.getenv("PREFETCH_CACHE_SIZE", "32"))
+PREFETCH_HALF_LIFE_S = float(os.getenv("PREFETCH_HALF_LIFE_S", "120"))
+# Collections to search, all collections if empty
+PREFETCH_COLLECTIONS = [name.strip() for name in os.getenv("PREFETCH_COLLECTIONS", "").split(",") if name.strip()]
+PREFETCH_RESULTS_PER_TERM = int(os.getenv("PREFETCH_RESULTS_PER_TERM", "2"))
+
+# Rules that come up at the table without being capitalized
+RULE_TERMS = (
+    "blinded", "charmed", "deafened", "exhaustion", "frightened", "grappled", "incapacitated", "invisible",
+    "paralyzed", "petrified", "poisoned", "prone", "restrained", "stunned", "unconscious",
+    "opportunity attack", "attack of opportunity", "advantage", "disadvantage", "concentration",
+    "death saving throw", "saving throw", "ability check", "cover", "difficult terrain", "surprise",
+    "initiative", "short rest", "long rest", "grapple", "shove", "dash", "disengage", "dodge", "hide",
+    "ready action", "bonus action", "reaction", "two-weapon fighting", "critical hit", "falling",
+    "suffocating", "ritual", "spell slot", "counterspell", "legendary action", "lair action",
+)
+_RULE_RE = re.compile(r"\b(" + "|".join(sorted(map(re.escape, RULE_TERMS), key=len, reverse=True)) + r")\b", re.IGNORECASE)
+# Names of spells, creatures, places and NPCs: runs of capitalized words
+_NAME_RE = re.compile(r"\b[A-Z][\w']+(?:\s+(?:of|the|de|von)?\s*[A-Z][\w']+){0,3}")
+_SENTENCE_START_RE = re.compile(r"(^|[.!?:]\s+)$")
+
+
+def extract_candidates(text: str) -> List[str]:
+    """Return the rule terms and names mentioned in `text`, lower-cased, in order of appearance."""
+    candidates = [match.group(1).lower() for match in _RULE_RE.finditer(text)]
+    for match in _NAME_RE.finditer(text):
+        name = match.group(0)
+        # A single capitalized word at the start of a sentence is most likely not a name
+        if " " not in name and _SENTENCE_START_RE.search(text[:match.start()]):
+            continue
+        candidates.append(" ".join(name.lower().split()))
+    return list(dict.fromkeys(candidates))
+
+
+class SessionPrefetch:
+    def __init__(self):
+        self.scores: Dict[str, float] = {}
+        self.scored_at: Dict[str, float] = {}
+        self.passages: Dict[str, List[str]] = {}
+        self.in_flight: Set[asyncio.Task] = set()
+
+    def score(self, term: str, now: float) -> float:
+        return self.scores[term] * math.exp(-(now - self.scored_at[term]) * math.log(2) / PREFETCH_HALF_LIFE_S)
+
+
+class RetrievalPrefetcher:
+    """
+    Looks up the rules and names mentioned in the talk of every session while
+    the talk is still accumulating, so tips can be given rulebook context
+    without waiting for retrieval.
+
+    Every mention raises the score of a term, and scores decay with
+    PREFETCH_HALF_LIFE_S. `context` returns the best passages of the highest
+    scoring terms, waiting at most PREFETCH_BUDGET_MS for lookups in flight.
+    """
+
+    def __init__(self, lookup: Callable[[List[str]], Awaitable[Dict[str, List[str]]]]):
+        self.lookup = lookup
+        self.sessions: Dict[str, SessionPrefetch] = {}
+
+    def observe(self, session_id: str, talk: str):
+        """Score the terms in `talk` and start looking up the new ones. Must be called from the event loop."""
+        session = self.sessions.setdefault(session_id, SessionPrefetch())
+        now = time.monotonic()
+        new_terms = []
+        for term in extract_candidates(talk):
+            if term in session.scores:
+                session.scores[term] = session.score(term, now) + 1.0
+            else:
+                session.scores[term] = 1.0
+                new_terms.append(term)
+            session.scored_at[term] = now
+        # Forget the terms that matter least
+        for term in sorted(session.scores, key=lambda term: session.score(term, now))[:-PREFETCH_CACHE_SIZE]:
+            del session.scores[term], session.scored_at[term]
+            session.passages.pop(term, None)
+        if new_terms:
+            task = asyncio.create_task(self._fetch(session, new_terms))
+            session.in_flight.add(task)
+            task.add_done_callback(session.in_flight.discard)
+
+    async def _fetch(self, session: SessionPrefetch, terms: List[str]):
+        try:
+            found = await self.lookup(terms)
+        except Exception as e:
+            logger.exception(f"Prefetching {terms} failed: {e}")
+            return
+        for term, passages in found.items():
+            # The term may have been evicted while it was looked up
+            if term in session.scores:
+                session.passages[term] = passages
+
+    async def context(self, session_id: str) -> str:
+        """The best passages for the session's recent talk, formatted to attach to the tip's inputs."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return ''
+        if session.in_flight:
+            await asyncio.wait(set(session.in_flight), timeout=PREFETCH_BUDGET_MS / 1000)
+        now = time.monotonic()
+        selected = []
+        for term in sorted(session.passages, key=lambda term: session.score(term, now), reverse=True):
+            for passage in session.passages[term]:
+                if passage not in selected:
+                    selected.append(passage)
+                    break
+            if len(selected) >= PREFETCH_PASSAGES:
+                break
+        if not selected:
+            return ''
+        return '\n\nPassages from the rulebooks and adventures that may be relevant:\n\n' + '\n\n---\n\n'.join(
+            passage[:PREFETCH_MAX_CHARS] for passage in selected
+        )
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Talk is batched until nobody spoke for TALK_DEBOUNCE_MS, but at most
+# TALK_MAX_WAIT_MS after the oldest talk that is not in a tip yet
+TALK_DEBOUNCE_MS = int(os.getenv("TALK_DEBOUNCE_MS", "1500"))
+TALK_MAX_WAIT_MS = int(os.getenv("TALK_MAX_WAIT_MS", "8000"))
+# Cancel a tip that is still generating when the next batch of talk is ready
+TALK_CANCEL_STALE = os.getenv("TALK_CANCEL_STALE", "1") == "1"
+
+
+class TalkSession:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.pending: List[str] = []
+        self.first_pending_at: Optional[float] = None
+        self.talk_arrived = asyncio.Event()
+        self.runner: Optional[asyncio.Task] = None
+        self.generation: Optional[asyncio.Task] = None
+        self.generation_talk = ''
+        self.generation_sent = False  # the service has the talk of the current generation
+
+    def take_pending(self) -> str:
+        talk = '\n'.join(self.pending)
+        self.pending = []
+        self.first_pending_at = None
+        return talk
+
+
+class TalkScheduler:
+    """
+    Batches the talk of every session and hands it to `generate(session_id, talk)`.
+
+    Each session has a runner task that sleeps until talk arrives, so idle
+    sessions cost nothing. When a batch is ready while the previous tip of the
+    session is still generating, that generation is cancelled, so tips never lag
+    behind the table. Its talk is sent again together with the new talk, unless
+    `generate` already sent it and called `mark_sent`: the conversation has it
+    then, and sending it again would repeat it.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[str, str], Awaitable[None]],
+        debounce: float = TALK_DEBOUNCE_MS / 1000,
+        max_wait: float = TALK_MAX_WAIT_MS / 1000,
+        cancel_stale: bool = TALK_CANCEL_STALE,
+    ):
+        self.generate = generate
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.cancel_stale = cancel_stale
+        self.sessions: Dict[str, TalkSession] = {}
+
+    def submit(self, session_id: str, talk: str):
+        """Queue talk for a session. Must be called from the event loop."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = TalkSession(session_id)
+        if session.runner is None or session.runner.done():
+            session.runner = asyncio.create_task(self._run(session))
+        if session.first_pending_at is None:
+            session.first_pending_at = asyncio.get_running_loop().time()
+        session.pending.append(talk)
+        session.talk_arrived.set()
+
+    def mark_sent(self, session_id: str):
+        """Called by `generate` once its talk went out, so a cancelled generation doesn't send it twice."""
+        self.sessions[session_id].generation_sent = True
+
+    async def _collect(self, session: TalkSession):
+        """Wait until the talk pauses for `debounce` or the oldest pending talk is `max_wait` old."""
+        loop = asyncio.get_running_loop()
+        while True:
+            session.talk_arrived.clear()
+            timeout = min(self.debounce, session.first_pending_at + self.max_wait - loop.time())
+            if timeout <= 0:
+                return
+            try:
+                await asyncio.wait_for(session.talk_arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
+
+    async def _run(self, session: TalkSession):
+        while True:
+            await session.talk_arrived.wait()
+            await self._collect(session)
+            generation = session.generation
+            if generation is not None and not generation.done():
+                if self.cancel_stale and generation.cancel():
+                    if not session.generation_sent:
+                        # The stale tip never got its talk out, so it goes into the next one
+                        session.pending.insert(0, session.generation_talk)
+                    logger.info(f"Cancelled stale tip of session {session.session_id}")
+                await asyncio.wait([generation])
+            if not session.pending:
+                continue
+            session.generation_talk = session.take_pending()
+            session.generation_sent = False
+            session.generation = asyncio.create_task(self._generate(session, session.generation_talk))
+
+    async def _generate(self, session: TalkSession, talk: str):
+        try:
+            await self.generate(session.session_id, talk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Generating a tip for session {session.session_id} failed: {e}")
+
+    async def close(self):
+        tasks = [task for session in self.sessions.values() for task in (session.runner, session.generation) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,125 @@
+import re
+from typing import Dict, Optional
+
+import yaml
+
+TIP_FIELDS = ('relatedGameRule', 'readThisTextToYourPlayers', 'whatCouldHappenNext')
+
+_KEY_RE = re.compile(r'^(' + '|'.join(TIP_FIELDS) + r')\s*:(.*)$')
+
+
+class TipStreamParser:
+    """
+    Incremental parser for the streamed YAML tip.
+
+    Every chunk is scanned once: the parser tracks which top-level key is
+    streaming and collects the text appended to each field since the last
+    `take_deltas()`. Deltas follow the text as it is displayed rather than
+    exact YAML semantics (block scalars keep their line breaks, quotes are
+    dropped), which renders the same in markdown. The exact values come from
+    a single `yaml.safe_load` of the whole response in `result()`.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.texts: Dict[str, str] = {field: '' for field in TIP_FIELDS}
+        self._deltas: Dict[str, str] = {}
+        self._line = ''
+        self._line_emitted = 0  # characters of the current line's display text already emitted
+        self._line_is_key = False
+        self._field: Optional[str] = None
+        self._block = False
+        self._indent: Optional[int] = None
+        self._quote = ''
+        self._has_text = False
+
+    def feed(self, chunk: str):
+        self.buffer += chunk
+        lines = (self._line + chunk).split('\n')
+        for line in lines[:-1]:
+            self._handle(line, complete=True)
+            self._line, self._line_emitted, self._line_is_key = '', 0, False
+        self._line = lines[-1]
+        self._handle(self._line, complete=False)
+
+    def take_deltas(self) -> Dict[str, str]:
+        deltas, self._deltas = self._deltas, {}
+        return deltas
+
+    def result(self) -> Dict[str, str]:
+        """The complete tip. Falls back to the streamed text if the response is not valid YAML."""
+        try:
+            tip = yaml.safe_load(self.buffer)
+        except yaml.YAMLError:
+            tip = None
+        if not isinstance(tip, dict):
+            return dict(self.texts)
+        return {field: str(tip.get(field) or '') for field in TIP_FIELDS}
+
+    def _emit(self, text: str):
+        if text:
+            self.texts[self._field] += text
+            self._deltas[self._field] = self._deltas.get(self._field, '') + text
+
+    def _handle(self, line: str, complete: bool):
+        if line[:1] not in ('', ' ', '\t') and not self._line_is_key:
+            # A line at column 0 starts a new key, wait until its colon is in
+            match = _KEY_RE.match(line)
+            if match is None:
+                # Not one of ours (e.g. a code fence), or the key is not complete yet
+                return
+            self._start_field(match.group(1))
+            self._line_is_key = True
+        if self._field is None:
+            return
+
+        if self._line_is_key:
+            value = _KEY_RE.match(line).group(2).strip()
+            if value[:1] in ('|', '>'):
+                # Block scalar indicator: the text starts on the next line
+                self._block = True
+                return
+            if not self._quote and value[:1] in ('"', "'"):
+                self._quote = value[0]
+            display = value[1:] if self._quote else value
+        elif self._block:
+            if not line.strip():
+                display = ''
+            else:
+                if self._indent is None:
+                    self._indent = len(line) - len(line.lstrip())
+                display = line[self._indent:]
+        else:
+            # Continuation of a multi-line plain or quoted scalar
+            display = line.strip()
+            if display and self._has_text and not self._line_emitted:
+                self._emit(' ')
+                self._line_emitted = 0
+
+        if self._quote:
+            display = self._unquote(display)
+        self._emit(display[self._line_emitted:])
+        self._line_emitted = max(self._line_emitted, len(display))
+        self._has_text = self._has_text or bool(display)
+        if complete and self._block:
+            self._emit('\n')
+
+    def _unquote(self, display: str) -> str:
+        """Drop the closing quote and unescape quotes. Undecided escapes at the end are held back."""
+        if self._quote == '"':
+            if display.endswith('"') and not display.endswith('\\"') or display.endswith('\\'):
+                display = display[:-1]
+            return display.replace('\\"', '"')
+        # In single quoted scalars '' is an escaped quote, an odd number of quotes at the end closes it
+        if (len(display) - len(display.rstrip("'"))) % 2:
+            display = display[:-1]
+        return display.replace("''", "'")
+
+    def _start_field(self, field: str):
+        self._field = field
+        self._block = False
+        self._indent = None
+        self._quote = ''
+        self._has_text = False
+        self._line_emitted = 0
+        self.texts[field] = ''
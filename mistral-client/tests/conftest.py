@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The service's modules import each other by bare name, like when run from src
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,139 @@
+import asyncio
+
+import fanout
+from fanout import ConnectionManager
+
+
+class FakeWebSocket:
+    """Records sent messages. A blocked socket takes every send until it is released."""
+
+    def __init__(self, blocked: bool = False, fails: bool = False):
+        self.sent = []
+        self.closed = False
+        self.fails = fails
+        self.released = asyncio.Event()
+        if not blocked:
+            self.released.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        await self.released.wait()
+        if self.fails:
+            raise ConnectionError('gone')
+        self.sent.append(text)
+
+    async def close(self):
+        self.closed = True
+
+
+def delta(tip_id: int, text: str) -> dict:
+    return {'type': 'delta', 'tipId': tip_id, 'fields': {'readThisTextToYourPlayers': text}}
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_a_slow_subscriber_does_not_hold_up_the_others():
+    async def scenario():
+        manager = ConnectionManager()
+        slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+        await manager.connect(slow, 'table')
+        await manager.connect(fast, 'table')
+        for index in range(20):
+            manager.broadcast({'type': 'status', 'index': index}, 'table')
+            await settle()
+        return slow, fast
+
+    slow, fast = asyncio.run(scenario())
+    assert len(fast.sent) == 20
+    assert slow.sent == []
+
+
+def test_a_slow_subscriber_skips_ahead_to_the_current_tip():
+    async def scenario():
+        manager = ConnectionManager()
+        slow = FakeWebSocket(blocked=True)
+        await manager.connect(slow, 'table')
+        manager.broadcast(delta(1, 'The'), 'table')
+        await settle()
+        # The first send is stuck, everything after it is queued
+        manager.broadcast(delta(1, ' ogre'), 'table')
+        manager.broadcast(delta(2, 'Roll'), 'table')
+        manager.broadcast(delta(2, ' for'), 'table')
+        manager.broadcast(delta(2, ' initiative'), 'table')
+        slow.released.set()
+        await settle()
+        return slow
+
+    slow = asyncio.run(scenario())
+    assert slow.sent == [
+        '{"type": "delta", "tipId": 1, "fields": {"readThisTextToYourPlayers": "The"}}',
+        '{"type": "delta", "tipId": 2, "fields": {"readThisTextToYourPlayers": "Roll for initiative"}}',
+    ]
+
+
+def test_a_complete_tip_replaces_its_queued_deltas():
+    async def scenario():
+        manager = ConnectionManager()
+        slow = FakeWebSocket(blocked=True)
+        await manager.connect(slow, 'table')
+        manager.broadcast({'type': 'status'}, 'table')
+        await settle()
+        manager.broadcast(delta(1, 'The'), 'table')
+        manager.broadcast({'type': 'tip', 'tipId': 1, 'complete': True}, 'table')
+        slow.released.set()
+        await settle()
+        return slow
+
+    slow = asyncio.run(scenario())
+    assert slow.sent == ['{"type": "status"}', '{"type": "tip", "tipId": 1, "complete": true}']
+
+
+def test_a_subscriber_that_stops_reading_is_dropped(monkeypatch):
+    monkeypatch.setattr(fanout, 'SUBSCRIBER_SEND_TIMEOUT', 0.05)
+
+    async def scenario():
+        manager = ConnectionManager()
+        stuck, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+        await manager.connect(stuck, 'table')
+        await manager.connect(fast, 'table')
+        manager.broadcast({'type': 'status'}, 'table')
+        await asyncio.sleep(0.1)
+        return manager, stuck, fast
+
+    manager, stuck, fast = asyncio.run(scenario())
+    assert [subscriber.websocket for subscriber in manager.active_connections['table']] == [fast]
+    assert stuck.closed
+
+
+def test_a_failed_send_drops_the_subscriber_and_its_session():
+    async def scenario():
+        manager = ConnectionManager()
+        broken = FakeWebSocket(fails=True)
+        await manager.connect(broken, 'table')
+        manager.broadcast({'type': 'status'}, 'table')
+        await settle()
+        return manager, broken
+
+    manager, broken = asyncio.run(scenario())
+    assert manager.active_connections == {}
+    assert broken.closed
+
+
+def test_sessions_only_get_their_own_messages():
+    async def scenario():
+        manager = ConnectionManager()
+        first, second = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(first, 'a')
+        await manager.connect(second, 'b')
+        manager.broadcast({'type': 'status'}, 'a')
+        await settle()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.sent == ['{"type": "status"}']
+    assert second.sent == []
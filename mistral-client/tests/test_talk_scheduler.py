@@ -0,0 +1,142 @@
+import asyncio
+
+from talk_scheduler import TalkScheduler
+
+
+class Recorder:
+    """A `generate` that records its calls and can hold a generation open, before or after sending."""
+
+    def __init__(self, hold: float = 0.0, send_before_hold: bool = False):
+        self.calls = []
+        self.cancelled = []
+        self.hold = hold
+        self.send_before_hold = send_before_hold
+        self.scheduler = None
+
+    async def __call__(self, session_id: str, talk: str):
+        self.calls.append((session_id, talk))
+        try:
+            if self.send_before_hold:
+                self.scheduler.mark_sent(session_id)
+            await asyncio.sleep(self.hold)
+        except asyncio.CancelledError:
+            self.cancelled.append(talk)
+            raise
+
+
+def scheduler_for(recorder: Recorder, **kwargs) -> TalkScheduler:
+    scheduler = TalkScheduler(recorder, **kwargs)
+    recorder.scheduler = scheduler
+    return scheduler
+
+
+def test_talk_is_batched_until_it_pauses():
+    async def scenario():
+        recorder = Recorder()
+        scheduler = scheduler_for(recorder, debounce=0.05, max_wait=1.0)
+        scheduler.submit("table", "I attack")
+        await asyncio.sleep(0.02)
+        scheduler.submit("table", "with my sword")
+        await asyncio.sleep(0.03)
+        assert recorder.calls == []
+        await asyncio.sleep(0.05)
+        await scheduler.close()
+        return recorder.calls
+
+    assert asyncio.run(scenario()) == [("table", "I attack\nwith my sword")]
+
+
+def test_continuous_talk_is_sent_after_max_wait():
+    async def scenario():
+        recorder = Recorder()
+        scheduler = scheduler_for(recorder, debounce=0.05, max_wait=0.1)
+        for index in range(10):
+            scheduler.submit("table", f"line {index}")
+            await asyncio.sleep(0.02)
+        calls = list(recorder.calls)
+        await scheduler.close()
+        return calls
+
+    calls = asyncio.run(scenario())
+    # Nobody paused for the debounce, but the first batch went out anyway
+    assert calls and calls[0][1].startswith("line 0\nline 1")
+
+
+def test_sessions_are_batched_independently():
+    async def scenario():
+        recorder = Recorder()
+        scheduler = scheduler_for(recorder, debounce=0.02, max_wait=1.0)
+        scheduler.submit("a", "talk of a")
+        scheduler.submit("b", "talk of b")
+        await asyncio.sleep(0.06)
+        await scheduler.close()
+        return sorted(recorder.calls)
+
+    assert asyncio.run(scenario()) == [("a", "talk of a"), ("b", "talk of b")]
+
+
+def test_a_stale_tip_that_did_not_send_its_talk_is_cancelled_and_its_talk_resent():
+    async def scenario():
+        recorder = Recorder(hold=1.0)
+        scheduler = scheduler_for(recorder, debounce=0.02, max_wait=1.0)
+        scheduler.submit("table", "the ogre charges")
+        await asyncio.sleep(0.04)
+        scheduler.submit("table", "I dodge")
+        await asyncio.sleep(0.04)
+        await scheduler.close()
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert recorder.cancelled[0] == "the ogre charges"
+    assert [talk for _, talk in recorder.calls] == ["the ogre charges", "the ogre charges\nI dodge"]
+
+
+def test_a_stale_tip_that_sent_its_talk_is_cancelled_without_resending_it():
+    async def scenario():
+        recorder = Recorder(hold=1.0, send_before_hold=True)
+        scheduler = scheduler_for(recorder, debounce=0.02, max_wait=1.0)
+        scheduler.submit("table", "the ogre charges")
+        await asyncio.sleep(0.04)
+        scheduler.submit("table", "I dodge")
+        await asyncio.sleep(0.04)
+        await scheduler.close()
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert recorder.cancelled[0] == "the ogre charges"
+    assert [talk for _, talk in recorder.calls] == ["the ogre charges", "I dodge"]
+
+
+def test_without_cancel_stale_the_running_tip_is_awaited():
+    async def scenario():
+        recorder = Recorder(hold=0.05)
+        scheduler = scheduler_for(recorder, debounce=0.01, max_wait=1.0, cancel_stale=False)
+        scheduler.submit("table", "first")
+        await asyncio.sleep(0.02)
+        scheduler.submit("table", "second")
+        await asyncio.sleep(0.12)
+        await scheduler.close()
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert recorder.cancelled == []
+    assert [talk for _, talk in recorder.calls] == ["first", "second"]
+
+
+def test_a_failing_generation_does_not_stop_the_session():
+    async def scenario():
+        calls = []
+
+        async def generate(session_id: str, talk: str):
+            calls.append(talk)
+            raise RuntimeError("the API is down")
+
+        scheduler = TalkScheduler(generate, debounce=0.01, max_wait=1.0)
+        scheduler.submit("table", "first")
+        await asyncio.sleep(0.03)
+        scheduler.submit("table", "second")
+        await asyncio.sleep(0.03)
+        await scheduler.close()
+        return calls
+
+    assert asyncio.run(scenario()) == ["first", "second"]
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from tip_stream import TipStreamParser
+
+RESPONSE = '''relatedGameRule: "Grappling uses an \\"Athletics\\" check"
+readThisTextToYourPlayers: |
+  The ogre roars.
+  Its club swings low.
+whatCouldHappenNext: 'The ogre''s friends
+  arrive soon'
+'''
+
+EXPECTED = {
+    'relatedGameRule': 'Grappling uses an "Athletics" check',
+    'readThisTextToYourPlayers': 'The ogre roars.\nIts club swings low.\n',
+    'whatCouldHappenNext': "The ogre's friends arrive soon",
+}
+
+
+def split_randomly(text: str, seed: int) -> list:
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, len(text) // 4)))
+    return [text[start:stop] for start, stop in zip([0] + cuts, cuts + [len(text)])]
+
+
+def stream(chunks) -> tuple:
+    """Feed the chunks and return the concatenated deltas and the parser."""
+    parser = TipStreamParser()
+    streamed = {}
+    for chunk in chunks:
+        parser.feed(chunk)
+        for field, text in parser.take_deltas().items():
+            streamed[field] = streamed.get(field, '') + text
+    return streamed, parser
+
+
+@pytest.mark.parametrize('chunks', [
+    [RESPONSE],
+    list(RESPONSE),
+    RESPONSE.splitlines(keepends=True),
+    *[split_randomly(RESPONSE, seed) for seed in range(20)],
+], ids=lambda chunks: f'{len(chunks)} chunks')
+def test_the_chunking_does_not_change_the_streamed_text(chunks):
+    streamed, parser = stream(chunks)
+    assert streamed == EXPECTED
+    assert parser.texts == EXPECTED
+    assert parser.result() == EXPECTED
+
+
+def test_a_closing_quote_is_never_streamed():
+    parser = TipStreamParser()
+    parser.feed('relatedGameRule: "Roll a d20')
+    assert parser.take_deltas() == {'relatedGameRule': 'Roll a d20'}
+    parser.feed('"\n')
+    assert parser.take_deltas() == {}
+
+
+def test_a_code_fence_around_the_tip_is_ignored():
+    streamed, parser = stream(split_randomly('```yaml\n' + RESPONSE + '```\n', seed=7))
+    assert streamed == EXPECTED
+    assert parser.texts == EXPECTED
+
+
+def test_invalid_yaml_falls_back_to_the_streamed_text():
+    _, parser = stream(['relatedGameRule: Grappling: see page 12\n', 'whatCouldHappenNext: [a fight\n'])
+    assert parser.result() == {
+        'relatedGameRule': 'Grappling: see page 12',
+        'readThisTextToYourPlayers': '',
+        'whatCouldHappenNext': '[a fight',
+    }